@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Measures the time taken by "from freepybox import Freepybox; Freepybox()"
+in fresh interpreters, and checks that no heavy dependency is imported
+before a freebox is opened. Exits with status 1 on a regression:
+    python benchmarks/import_time.py --runs 20 --max-ms 50
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Modules which must only be imported when a freebox is opened or a module used
+heavy_modules = ['requests', 'urllib3', 'asyncio', 'ssl', 'aiohttp', 'httpx', 'numpy', 'concurrent.futures', 'hmac']
+
+probe = '''
+import sys, time, json
+start = time.perf_counter()
+from freepybox import Freepybox
+Freepybox()
+elapsed = time.perf_counter() - start
+print(json.dumps({'ms': elapsed * 1000, 'heavy': [m for m in %r if m in sys.modules]}))
+''' % (heavy_modules,)
+
+
+def measure(runs):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    results = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', probe], env=env, check=True, capture_output=True, text=True)
+        results.append(json.loads(out.stdout))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='freepybox import time benchmark')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--max-ms', type=float, default=50, help='maximum median import time')
+    args = parser.parse_args()
+
+    results = measure(args.runs)
+    times = sorted(r['ms'] for r in results)
+    heavy = sorted(set(m for r in results for m in r['heavy']))
+
+    print('import time over {0} runs: median {1:.1f} ms, min {2:.1f} ms, max {3:.1f} ms'.format(
+        args.runs, statistics.median(times), times[0], times[-1]))
+
+    failed = False
+    if heavy:
+        print('heavy modules imported eagerly: {0}'.format(', '.join(heavy)))
+        failed = True
+    if statistics.median(times) > args.max_ms:
+        print('median import time above {0} ms'.format(args.max_ms))
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Compares the json codecs on freebox response bodies: the stdlib path used
+before (bytes decoded to text, then json.loads, as requests' r.json()) and
+the freepybox codecs decoding straight from bytes.
+Recorded bodies can be given with --payload, otherwise bodies shaped like
+call/log/, lan/browser/pub/ and a large fs/ls/ listing are generated:
+    python benchmarks/json_codec.py --payload call_log.json --number 200
+'''
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from freepybox.codec import codecs
+
+
+def call_log(n=1000):
+    return {'success': True, 'result': [
+        {'number': '06{0:08d}'.format(random.randrange(10 ** 8)), 'type': random.choice(['accepted', 'missed', 'outgoing']),
+         'id': i, 'duration': random.randrange(600), 'datetime': 1700000000 + i * 3600,
+         'contact_id': 0, 'line_id': 0, 'name': 'Contact {0}'.format(i), 'new': random.random() < 0.1}
+        for i in range(n)]}
+
+
+def lan_hosts(n=200):
+    return {'success': True, 'result': [
+        {'l2ident': {'id': '00:24:d4:{0:02x}:{1:02x}:{2:02x}'.format(i, i, i), 'type': 'mac_address'},
+         'active': True, 'persistent': False, 'names': [{'name': 'host-{0}'.format(i), 'source': 'dhcp'}],
+         'vendor_name': 'Freebox SAS', 'host_type': 'workstation', 'interface': 'pub', 'id': 'ether-{0}'.format(i),
+         'last_time_reachable': 1700000000, 'primary_name_manual': False,
+         'l3connectivities': [{'addr': '192.168.1.{0}'.format(i % 250), 'active': True, 'af': 'ipv4',
+                               'reachable': True, 'last_activity': 1700000000, 'last_time_reachable': 1700000000}],
+         'default_name': 'host-{0}'.format(i), 'first_activity': 1600000000, 'reachable': True, 'last_activity': 1700000000,
+         'primary_name': 'host-{0}'.format(i)}
+        for i in range(n)]}
+
+
+def fs_listing(n=5000):
+    return {'success': True, 'result': [
+        {'type': 'file', 'index': i, 'link': False, 'modification': 1700000000 + i, 'hidden': False,
+         'mimetype': 'video/x-matroska', 'name': 'Vidéo {0}.mkv'.format(i),
+         'path': 'L0Rpc3F1ZSBkdXIvVmlkw6lvcy9WaWTDqW8g{0}'.format(i), 'size': random.randrange(1 << 32)}
+        for i in range(n)]}
+
+
+def text_loads(data):
+    return json.loads(data.decode('utf-8'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='freepybox json codec benchmark')
+    parser.add_argument('--payload', action='append', default=[], help='recorded response body file')
+    parser.add_argument('--number', type=int, default=50, help='decodes per measure')
+    args = parser.parse_args()
+
+    random.seed(0)
+    if args.payload:
+        payloads = {os.path.basename(p): open(p, 'rb').read() for p in args.payload}
+    else:
+        payloads = {name: json.dumps(make()).encode() for name, make in
+                    (('call/log/', call_log), ('lan/browser/pub/', lan_hosts), ('fs/ls/', fs_listing))}
+
+    available = {}
+    for name, codec in codecs.items():
+        try:
+            available[name] = codec()
+        except ImportError:
+            print('{0}: not installed'.format(name))
+
+    for payload_name, data in payloads.items():
+        obj = json.loads(data)
+        print('{0} ({1} kB)'.format(payload_name, len(data) // 1024))
+        base = min(timeit.repeat(lambda: text_loads(data), number=args.number, repeat=5)) / args.number
+        print('  {0:<20} loads {1:8.3f} ms'.format('r.json() (stdlib)', base * 1000))
+        for name, codec in available.items():
+            loads = min(timeit.repeat(lambda: codec.loads(data), number=args.number, repeat=5)) / args.number
+            dumps = min(timeit.repeat(lambda: codec.dumps(obj), number=args.number, repeat=5)) / args.number
+            print('  {0:<20} loads {1:8.3f} ms  x{2:<5.1f} dumps {3:8.3f} ms'.format(name, loads * 1000, base / loads, dumps * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,729 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Local HTTPS stand-in of a freebox, to measure and test freepybox offline.
+It implements the authorization and login flow (login/authorize/, login,
+login/session/) and answers the endpoints used by freepybox/api with
+generated data, after a configurable latency. The ws/event websocket
+pushes the notifications given to notify(), files sent on ws/upload are
+kept in uploads and served on fs/ls, fs/info and dl/:
+    python benchmarks/mock_freebox.py --port 8443 --latency 5 --hosts 200
+
+From python:
+    with MockFreebox(latency=0.005, hosts=200) as box:
+        fbx = Freepybox(token_file='mock_auth', transport=box.transport())
+        fbx.open(box.host, box.port)
+'''
+import argparse
+import base64
+import collections
+import email.utils
+import hashlib
+import hmac
+import json
+import os
+import posixpath
+import random
+import re
+import secrets
+import select
+import ssl
+import struct
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+here = os.path.dirname(os.path.abspath(__file__))
+cert_file = os.path.join(here, 'mock_freebox.crt')
+key_file = os.path.join(here, 'mock_freebox.key')
+
+sys.path.insert(0, os.path.dirname(here))
+from freepybox.instrument import endpoint_template
+
+_api_path = re.compile(r'^/api/v\d+/(.*)$')
+
+# Key suffix of the websocket handshake answer (RFC 6455)
+_ws_guid = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+class MockFreebox:
+    '''
+    HTTPS server answering like a freebox on host:port (port 0 picks a free port):
+        latency, jitter: seconds waited before each answer, plus up to jitter
+        hosts, calls, stations, ports: sizes of the LAN host list, call log,
+            wifi station lists and switch port list
+        files, dirs, depth: files and sub folders of each fs/ls folder
+            and depth of the folder tree
+        file_size: largest size of the generated files served on dl/
+        auto_grant: grant new applications at once instead of leaving them pending
+    '''
+    def __init__(self, host='127.0.0.1', port=0, latency=0, jitter=0, hosts=50, calls=200, stations=10, ports=4,
+                 files=50, dirs=3, depth=2, file_size=1 << 20, auto_grant=True, seed=0):
+        self.host = host
+        self.latency = latency
+        self.jitter = jitter
+        self.file_size = file_size
+        self.dirs = dirs
+        self.depth = depth
+        self.auto_grant = auto_grant
+        self.requests = collections.Counter()
+        # Files sent on ws/upload: path -> content
+        self.uploads = {}
+        # Modification dates of the uploaded files: path -> timestamp
+        self.upload_times = {}
+        # Close the next ws/upload websocket once the file holds this many bytes
+        self.upload_drop_at = None
+
+        self._lock = threading.Lock()
+        self._app_tokens = {}
+        self._tracks = []
+        self._challenges = collections.deque(maxlen=64)
+        self._sessions = set()
+        self._tasks = {}
+        self._websockets = set()
+        self._random = random.Random(seed)
+        self._build(hosts, calls, stations, ports, files)
+
+        self._server = _Server((host, port), _Handler)
+        self._server.mock = self
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_file, key_file)
+        self._server.socket = context.wrap_socket(self._server.socket, server_side=True)
+        self.port = self._server.server_address[1]
+        self._thread = None
+
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+
+    def stop(self):
+        self.drop_websockets()
+        self._server.shutdown()
+        self._server.server_close()
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+    def transport(self, **options):
+        '''
+        Returns a freepybox Transport trusting the mock certificate
+        '''
+        from freepybox.transport import Transport
+        return Transport(verify=cert_file, **options)
+
+
+    def write_token_file(self, path, app_desc=None):
+        '''
+        Write an application token file already authorized on the mock,
+        so that open() skips the authorization step
+        '''
+        from freepybox.freepybox import app_desc as default_app_desc
+        app_token = secrets.token_hex(32)
+        with self._lock:
+            self._app_tokens[app_token] = 'granted'
+        with open(path, 'w') as f:
+            json.dump({**(app_desc or default_app_desc), 'app_token': app_token, 'track_id': 0}, f)
+        return path
+
+
+    def expire_sessions(self):
+        '''
+        Invalidate the open sessions, the next requests get auth_required
+        '''
+        with self._lock:
+            self._sessions.clear()
+
+
+    def notify(self, event, result=None):
+        '''
+        Push the event notification (lan_host_l3addr_reachable...) to the
+        ws/event websockets registered for it, returns their number
+        '''
+        source, _, name = event.partition('_')
+        with self._lock:
+            websockets = [ws for ws in self._websockets if event in ws.events]
+        for ws in websockets:
+            ws.send_json({'action': 'notification', 'success': True, 'source': source, 'event': name, 'result': result})
+        return len(websockets)
+
+
+    def subscribers(self, event):
+        '''
+        Returns the number of ws/event websockets registered for event
+        '''
+        with self._lock:
+            return sum(event in ws.events for ws in self._websockets)
+
+
+    def drop_websockets(self):
+        '''
+        Close the open websockets, like a box restarting its services
+        '''
+        with self._lock:
+            websockets = list(self._websockets)
+            self._websockets.clear()
+        for ws in websockets:
+            ws.close()
+
+
+    def _build(self, hosts, calls, stations, ports, files):
+        '''
+        Generate the answers of the static endpoints
+        '''
+        r = self._random
+        now = 1700000000
+
+        def host(i):
+            mac = '00:24:d4:{0:02x}:{1:02x}:{2:02x}'.format(i >> 16 & 255, i >> 8 & 255, i & 255)
+            return {'id': 'ether-' + mac, 'l2ident': {'id': mac, 'type': 'mac_address'}, 'active': r.random() < 0.8,
+                    'reachable': r.random() < 0.8, 'persistent': False, 'primary_name': 'host-{0}'.format(i),
+                    'primary_name_manual': False, 'names': [{'name': 'host-{0}'.format(i), 'source': 'dhcp'}],
+                    'vendor_name': 'Freebox SAS', 'host_type': 'workstation', 'interface': 'pub',
+                    'last_activity': now, 'last_time_reachable': now, 'first_activity': now - 86400,
+                    'l3connectivities': [{'addr': '192.168.1.{0}'.format(2 + i % 250), 'af': 'ipv4', 'active': True,
+                                          'reachable': True, 'last_activity': now, 'last_time_reachable': now}]}
+
+        self.hosts = [host(i) for i in range(hosts)]
+        self.calls = [{'id': i + 1, 'number': '06{0:08d}'.format(r.randrange(10 ** 8)), 'name': 'Contact {0}'.format(i),
+                       'type': r.choice(['accepted', 'missed', 'outgoing']), 'datetime': now + i * 600,
+                       'duration': r.randrange(600), 'new': r.random() < 0.1, 'contact_id': 0, 'line_id': 0}
+                      for i in reversed(range(calls))]
+        self.stations = [{'id': 'sta-{0}'.format(i), 'mac': host(i)['l2ident']['id'], 'hostname': 'host-{0}'.format(i),
+                          'rx_bytes': r.randrange(1 << 32), 'tx_bytes': r.randrange(1 << 32), 'rx_rate': r.randrange(1 << 20),
+                          'tx_rate': r.randrange(1 << 20), 'signal': -r.randrange(30, 90), 'state': 'authenticated',
+                          'host': host(i)} for i in range(stations)]
+        self.ports = [{'id': i + 1, 'link': 'up', 'speed': '1000', 'duplex': 'full', 'mode': '1000BaseT-FD',
+                       'mac_list': [{'mac': host(i)['l2ident']['id'], 'hostname': 'host-{0}'.format(i)}]}
+                      for i in range(ports)]
+        self.files = [{'name': 'Vidéo {0}.mkv'.format(i), 'type': 'file', 'mimetype': 'video/x-matroska',
+                       'size': r.randrange(1, self.file_size + 1), 'modification': now + i, 'index': i,
+                       'link': False, 'hidden': False}
+                      for i in range(files)]
+        self._file_infos = {f['name']: (f['size'], f['modification']) for f in self.files}
+
+        self.static = {
+            'system/': {'firmware_version': '4.7.0', 'mac': '00:24:d4:00:00:01', 'serial': '123456789',
+                        'uptime': '3 jours', 'uptime_val': 259200, 'board_name': 'fbxgw2r', 'temp_cpum': 60,
+                        'temp_sw': 50, 'temp_cpub': 55, 'fan_rpm': 2000, 'box_authenticated': True},
+            'connection': {'type': 'ethernet', 'state': 'up', 'media': 'ftth', 'ipv4': '203.0.113.1',
+                           'rate_up': 1000, 'rate_down': 5000, 'bandwidth_up': 600000000, 'bandwidth_down': 1000000000,
+                           'bytes_up': 1 << 40, 'bytes_down': 1 << 42},
+            'connection/config': {'ping': True, 'is_secure_pass': False, 'remote_access': False, 'wol': True},
+            'connection/ipv6/config': {'ipv6_enabled': True, 'delegations': []},
+            'connection/xdsl': {'status': {'status': 'showtime', 'modulation': 'vdsl'}},
+            'connection/ftth': {'sfp_present': True, 'sfp_alim_ok': True, 'sfp_has_signal': True, 'link': True},
+            'connection/logs': [{'id': i, 'type': 'link', 'state': 'up', 'date': now + i} for i in range(20)],
+            'lan/config/': {'ip': '192.168.1.254', 'name': 'Freebox Server', 'mode': 'router'},
+            'lan/browser/interfaces': [{'name': 'pub', 'host_count': len(self.hosts)}],
+            'dhcp/config/': {'enabled': True, 'ip_range_start': '192.168.1.1', 'ip_range_end': '192.168.1.50'},
+            'dhcp/dynamic_lease/': [{'mac': h['l2ident']['id'], 'ip': h['l3connectivities'][0]['addr'],
+                                     'hostname': h['primary_name'], 'lease_remaining': 3600} for h in self.hosts],
+            'dhcp/static_lease/': [],
+            'fw/redir/': [],
+            'fw/dmz/': {'enabled': False, 'ip': ''},
+            'phone/': [{'id': 0, 'type': 'fxs', 'is_ringing': False, 'on_hook': True}],
+            'phone/dect_vendors/': [],
+            'airmedia/config/': {'enabled': True, 'password': ''},
+            'freeplug/': [],
+            'wifi/config/': {'enabled': True, 'mac_filter_state': 'disabled'},
+            'wifi/ap/': [{'id': i, 'name': 'ap{0}'.format(i), 'status': {'state': 'active'}} for i in range(2)],
+            'wifi/bss/': [{'id': '00:24:d4:00:00:0{0}'.format(i), 'phy_id': i, 'status': {'state': 'active'}} for i in range(2)],
+            'switch/status/': self.ports,
+            'call/log/': self.calls,
+            'fs/tasks/': [],
+            }
+        self.static['connection/full'] = self.static['connection']
+
+
+    def answer(self, method, path, query, header, body):
+        '''
+        Returns (status, result) for a request on /api/vN/path, result being
+        the error body when status is an error
+        '''
+        if path == 'login/authorize/' and method == 'POST':
+            app_token = secrets.token_hex(32)
+            with self._lock:
+                self._app_tokens[app_token] = 'granted' if self.auto_grant else 'pending'
+                self._tracks.append(app_token)
+                track_id = len(self._tracks)
+            return 200, {'app_token': app_token, 'track_id': track_id}
+
+        m = re.match(r'^login/authorize/(\d+)$', path)
+        if m:
+            track_id = int(m.group(1))
+            status = self._app_tokens[self._tracks[track_id - 1]] if 0 < track_id <= len(self._tracks) else 'unknown'
+            return 200, {'status': status, 'challenge': self._challenge()}
+
+        if path in ('login', 'login/'):
+            return 200, {'logged_in': header in self._sessions, 'challenge': self._challenge()}
+
+        if path == 'login/session/' and method == 'POST':
+            request = json.loads(body or b'{}')
+            for app_token, status in list(self._app_tokens.items()):
+                if status != 'granted':
+                    continue
+                for challenge in list(self._challenges):
+                    if hmac.compare_digest(hmac.new(app_token.encode(), challenge.encode(), 'sha1').hexdigest(),
+                                           request.get('password', '')):
+                        session_token = secrets.token_urlsafe(48)
+                        with self._lock:
+                            self._sessions.add(session_token)
+                        return 200, {'session_token': session_token, 'challenge': challenge,
+                                     'permissions': {'settings': True, 'contacts': True, 'calls': True,
+                                                     'explorer': True, 'downloader': True, 'parental': True}}
+            return _error(403, 'invalid_token', 'invalid password')
+
+        if header not in self._sessions:
+            return _error(403, 'auth_required', 'authentication required')
+
+        if path == 'login/logout' and method == 'POST':
+            with self._lock:
+                self._sessions.discard(header)
+            return 200, None
+
+        if method == 'GET':
+            return self._get(path, query)
+        if method == 'POST' and path == 'rrd/':
+            return 200, self._rrd(json.loads(body or b'{}'))
+        if method == 'POST' and path in ('fs/cp/', 'fs/mv/', 'fs/rm/', 'fs/archive/'):
+            with self._lock:
+                task_id = len(self._tasks) + 1
+                self._tasks[task_id] = {'id': task_id, 'type': path[3:-1], 'state': 'done', 'error': 'none',
+                                        'progress': 100, 'nfiles': 1, 'nfiles_done': 1}
+            return 200, self._tasks[task_id]
+        if path.startswith('call/log/'):
+            return self._call_log(method, path[len('call/log/'):], body)
+        # Other writes are accepted and echoed
+        return 200, json.loads(body) if body else None
+
+
+    def ws_upload(self, ws):
+        '''
+        Serve the ws/upload websocket: upload_start, binary chunks appended
+        to the file, upload_finalize
+        '''
+        path = None
+        for opcode, payload in ws.messages():
+            if opcode == 0x2:
+                if path is None:
+                    ws.send_json({'action': 'upload_data', 'success': False, 'error_code': 'invalid_request'})
+                    continue
+                with self._lock:
+                    data = self.uploads[path]
+                    data += payload
+                    self.upload_times[path] = int(time.time())
+                    drop = self.upload_drop_at is not None and len(data) >= self.upload_drop_at
+                    if drop:
+                        self.upload_drop_at = None
+                if drop:
+                    ws.close()
+                continue
+
+            request = json.loads(payload)
+            action = request.get('action')
+            reply = {'action': action, 'request_id': request.get('request_id'), 'success': True}
+            if action == 'upload_start':
+                target = posixpath.join(base64.b64decode(request.get('dirname', '')).decode('utf-8'), request['filename'])
+                force = request.get('force')
+                with self._lock:
+                    if target in self.uploads and force not in ('overwrite', 'resume'):
+                        reply.update(success=False, error_code='destination_conflict')
+                    else:
+                        if force != 'resume' or target not in self.uploads:
+                            self.uploads[target] = bytearray()
+                            self.upload_times[target] = int(time.time())
+                        path = target
+            elif action == 'upload_finalize' and path is not None:
+                with self._lock:
+                    reply['result'] = {'total_len': len(self.uploads[path])}
+            else:
+                reply.update(success=False, error_code='invalid_request')
+            ws.send_json(reply)
+
+
+    def ws_event(self, ws):
+        '''
+        Serve the ws/event websocket: register, then the notify() notifications
+        '''
+        for opcode, payload in ws.messages():
+            request = json.loads(payload)
+            if request.get('action') == 'register':
+                ws.events.update(request.get('events') or [])
+                ws.send_json({'action': 'register', 'success': True})
+
+
+    def add_call(self, **fields):
+        '''
+        Add a new call to the call log and returns it
+        '''
+        with self._lock:
+            last = self.calls[0] if self.calls else {'id': 0, 'datetime': 1700000000}
+            call = {'id': last['id'] + 1, 'number': '0600000000', 'name': 'Contact', 'type': 'missed',
+                    'datetime': last['datetime'] + 60, 'duration': 0, 'new': True, 'contact_id': 0, 'line_id': 0, **fields}
+            self.calls.insert(0, call)
+        return call
+
+
+    def _call_log(self, method, call_id, body):
+        '''
+        Writes on call/log/: mark as read, delete, mark_all_as_read/, delete_all/
+        '''
+        with self._lock:
+            if method == 'POST' and call_id == 'mark_all_as_read/':
+                for call in self.calls:
+                    call['new'] = False
+                return 200, None
+            if method == 'POST' and call_id == 'delete_all/':
+                self.calls[:] = []
+                return 200, None
+            call = next((c for c in self.calls if str(c['id']) == call_id.rstrip('/')), None)
+            if call is None:
+                return _error(404, 'invalid_id', 'unknown call')
+            if method == 'PUT':
+                call.update(json.loads(body or b'{}'))
+                return 200, call
+            if method == 'DELETE':
+                self.calls.remove(call)
+                return 200, None
+        return _error(405, 'invalid_request', 'unsupported method')
+
+
+    def _challenge(self):
+        challenge = secrets.token_urlsafe(24)
+        self._challenges.append(challenge)
+        return challenge
+
+
+    def _get(self, path, query):
+        if path in self.static:
+            return 200, self.static[path]
+
+        m = re.match(r'^lan/browser/pub/?$', path)
+        if m:
+            return 200, self.hosts
+        m = re.match(r'^lan/browser/pub/(.+)$', path)
+        if m:
+            host = next((h for h in self.hosts if h['id'] == m.group(1)), None)
+            return (200, host) if host else _error(404, 'nodev', 'unknown host')
+        m = re.match(r'^switch/port/(\d+)(/stats)?/?$', path)
+        if m:
+            if m.group(2):
+                n = self.requests['switch/port/{id}/stats']
+                return 200, {'rx_good_bytes': 1000 * n, 'tx_bytes': 2000 * n, 'rx_good_packets': n,
+                             'tx_packets': 2 * n, 'rx_err_packets': 0, 'tx_collisions': 0}
+            return 200, self.ports[int(m.group(1)) - 1]
+        m = re.match(r'^wifi/ap/(\d+)/stations/?$', path)
+        if m:
+            return 200, self.stations
+        m = re.match(r'^wifi/(ap|bss)/([^/]+)(/.*)?$', path)
+        if m:
+            return 200, [] if m.group(3) else {'id': m.group(2), 'status': {'state': 'active'}}
+        m = re.match(r'^freeplug/(.+)/$', path)
+        if m:
+            return 200, {'id': m.group(1), 'net_role': 'sta'}
+        m = re.match(r'^fs/tasks/(\d+)$', path)
+        if m:
+            task = self._tasks.get(int(m.group(1)))
+            return (200, task) if task else _error(404, 'task_notfound', 'unknown task')
+        m = re.match(r'^fs/(ls|info)/(.*)$', path)
+        if m:
+            folder = base64.b64decode(m.group(2)).decode('utf-8')
+            if m.group(1) == 'info':
+                name = os.path.basename(folder.rstrip('/'))
+                info = self._file_info(folder)
+                if info is not None:
+                    return 200, {'name': name, 'type': 'file', 'mimetype': 'application/octet-stream',
+                                 'modification': info[1], 'path': m.group(2), 'size': info[0]}
+                return 200, {'name': name, 'type': 'dir', 'modification': 1700000000, 'path': m.group(2), 'size': 0}
+            return 200, self._listing(folder, query)
+        return _error(404, 'invalid_request', 'unknown endpoint ' + path)
+
+
+    def _file_info(self, path):
+        '''
+        Returns (size, modification) of the uploaded or generated file at
+        path, None when path is not a file
+        '''
+        with self._lock:
+            if path in self.uploads:
+                return len(self.uploads[path]), self.upload_times.get(path, 1700000000)
+        return self._file_infos.get(posixpath.basename(path))
+
+
+    def _listing(self, folder, query):
+        level = len([p for p in folder.split('/') if p])
+        entries = [{'name': '.', 'type': 'dir'}, {'name': '..', 'type': 'dir'}]
+        if level < self.depth:
+            entries += [{'name': 'Dossier {0}'.format(i), 'type': 'dir', 'size': 0, 'modification': 1700000000,
+                         'mimetype': 'inode/directory', 'index': i, 'link': False, 'hidden': False} for i in range(self.dirs)]
+        if 'onlyFolder=1' not in query:
+            entries += self.files
+            with self._lock:
+                entries += [{'name': posixpath.basename(p), 'type': 'file', 'mimetype': 'application/octet-stream',
+                             'size': len(data), 'modification': self.upload_times.get(p, 1700000000),
+                             'link': False, 'hidden': False}
+                            for p, data in self.uploads.items() if posixpath.dirname(p) == folder.rstrip('/')]
+        return [{**e, 'path': base64.b64encode('{0}/{1}'.format(folder.rstrip('/'), e['name']).encode()).decode()}
+                for e in entries]
+
+
+    def _rrd(self, request):
+        start = int(request.get('date_start', 0))
+        end = int(request.get('date_end', start + 3600))
+        fields = request.get('fields') or ['time', 'rate_up', 'rate_down']
+        step = 60
+        # A page holds at most 1000 points, like the freebox
+        times = range(start - start % step + step, min(end, start + 1000 * step) + 1, step)
+        return {'date_start': start, 'date_end': end,
+                'data': [{f: (t if f == 'time' else t % 997) for f in fields} for t in times]}
+
+
+    def download(self, path, range_header, if_range=None):
+        '''
+        Returns (status, bytes, headers) for dl/path, honoring a single bytes
+        range, unless if_range is not the file modification date
+        '''
+        path = base64.b64decode(path).decode('utf-8')
+        with self._lock:
+            content = bytes(self.uploads[path]) if path in self.uploads else None
+        info = self._file_info(path)
+        if info is None:
+            return 404, json.dumps({'success': False, 'error_code': 'not_found', 'msg': 'no such file'}).encode(), \
+                {'Content-Type': 'application/json; charset=utf-8'}
+        size = len(content) if content is not None else info[0]
+        last_modified = email.utils.formatdate(info[1], usegmt=True)
+        start, end = 0, size - 1
+        status = 200
+        m = re.match(r'bytes=(\d+)-(\d*)', range_header or '')
+        if m and if_range not in (None, last_modified):
+            m = None
+        if m:
+            start = int(m.group(1))
+            end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+            if start >= size:
+                return 416, b'', {'Content-Range': 'bytes */{0}'.format(size)}
+            status = 206
+        if content is not None:
+            data = content[start:end + 1]
+        else:
+            # Deterministic content, byte i of a generated file is i % 251
+            data = (bytes(range(251)) * ((end + 1) // 251 + 2))[start:end + 1]
+        headers = {'Content-Type': 'application/octet-stream', 'Accept-Ranges': 'bytes', 'Last-Modified': last_modified}
+        if status == 206:
+            headers['Content-Range'] = 'bytes {0}-{1}/{2}'.format(start, end, size)
+        return status, data, headers
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Concurrent clients open many connections at once
+    request_queue_size = 128
+
+
+def _error(status, error_code, msg):
+    return status, {'success': False, 'error_code': error_code, 'msg': msg}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body leave in one segment, without waiting for delayed acks
+    wbufsize = 1 << 16
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+
+    def _handle(self):
+        mock = self.server.mock
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else None
+
+        m = _api_path.match(self.path)
+        if m is None:
+            return self._send(*_error(404, 'invalid_request', 'not an api url'))
+        path, _, query = m.group(1).partition('?')
+
+        delay = mock.latency + (mock.jitter * random.random() if mock.jitter else 0)
+        if delay:
+            time.sleep(delay)
+        with mock._lock:
+            mock.requests[endpoint_template(path)] += 1
+
+        header = self.headers.get('X-Fbx-App-Auth')
+        if path in ('ws/event', 'ws/upload') and self.headers.get('Upgrade', '').lower() == 'websocket':
+            return self._websocket(path, header)
+        if path.startswith('dl/') and self.command == 'GET':
+            if header not in mock._sessions:
+                return self._send(*_error(403, 'auth_required', 'authentication required'))
+            status, data, headers = mock.download(path[3:], self.headers.get('Range'), self.headers.get('If-Range'))
+            return self._send_raw(status, data, headers)
+
+        status, result = mock.answer(self.command, path, query, header, body)
+        if status >= 400:
+            return self._send(status, result)
+        self._send(status, {'success': True, 'result': result} if result is not None else {'success': True})
+
+
+    def _send(self, status, obj):
+        self._send_raw(status, json.dumps(obj).encode(), {'Content-Type': 'application/json; charset=utf-8'})
+
+
+    def _send_raw(self, status, data, headers):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+    def _websocket(self, path, header):
+        '''
+        Upgrade the connection to a websocket and serve path on it
+        '''
+        mock = self.server.mock
+        if header not in mock._sessions:
+            return self._send(*_error(403, 'auth_required', 'authentication required'))
+
+        key = self.headers.get('Sec-WebSocket-Key', '')
+        self.send_response(101)
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', base64.b64encode(hashlib.sha1((key + _ws_guid).encode()).digest()).decode())
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = True
+
+        ws = _WebSocket(self.connection)
+        with mock._lock:
+            mock._websockets.add(ws)
+        try:
+            if path == 'ws/event':
+                mock.ws_event(ws)
+            else:
+                mock.ws_upload(ws)
+        except OSError:
+            pass
+        finally:
+            with mock._lock:
+                mock._websockets.discard(ws)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+
+class _WebSocket:
+    '''
+    Server side of a websocket on the socket of a request handler. The
+    handler thread reads and writes the frames, other threads queue
+    their messages with send_json() and close().
+    '''
+    def __init__(self, sock):
+        self.events = set()
+        self.closed = False
+        self._sock = sock
+        self._buffer = bytearray()
+        self._outbox = collections.deque()
+
+
+    def send_json(self, obj):
+        self._outbox.append(json.dumps(obj).encode())
+
+
+    def close(self):
+        self.closed = True
+
+
+    def messages(self):
+        '''
+        Yields the (opcode, payload) of the text and binary messages of the
+        client, answering its pings, until either side closes the websocket
+        '''
+        while not self.closed:
+            while self._outbox:
+                self._write(0x1, self._outbox.popleft())
+            if not (self._buffer or self._sock.pending() or select.select([self._sock], [], [], 0.02)[0]):
+                continue
+            opcode, payload = self._read_frame()
+            if opcode == 0x8:
+                break
+            if opcode == 0x9:
+                self._write(0xa, payload)
+            elif opcode in (0x1, 0x2):
+                yield opcode, payload
+        # Going away
+        self._write(0x8, struct.pack('!H', 1001))
+
+
+    def _read_frame(self):
+        b0, b1 = self._read(2)
+        length = b1 & 0x7f
+        if length == 126:
+            length, = struct.unpack('!H', self._read(2))
+        elif length == 127:
+            length, = struct.unpack('!Q', self._read(8))
+        mask = self._read(4) if b1 & 0x80 else None
+        payload = self._read(length)
+        if mask and length:
+            key = int.from_bytes((mask * (length // 4 + 1))[:length], 'big')
+            payload = (int.from_bytes(payload, 'big') ^ key).to_bytes(length, 'big')
+        return b0 & 0x0f, payload
+
+
+    def _read(self, n):
+        while len(self._buffer) < n:
+            data = self._sock.recv(1 << 16)
+            if not data:
+                raise ConnectionError('websocket closed by the client')
+            self._buffer += data
+        data = bytes(self._buffer[:n])
+        del self._buffer[:n]
+        return data
+
+
+    def _write(self, opcode, payload):
+        n = len(payload)
+        if n < 126:
+            head = struct.pack('!BB', 0x80 | opcode, n)
+        elif n < 1 << 16:
+            head = struct.pack('!BBH', 0x80 | opcode, 126, n)
+        else:
+            head = struct.pack('!BBQ', 0x80 | opcode, 127, n)
+        self._sock.sendall(head + payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='local mock freebox')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8443)
+    parser.add_argument('--latency', type=float, default=0, help='milliseconds before each answer')
+    parser.add_argument('--jitter', type=float, default=0, help='extra random milliseconds')
+    parser.add_argument('--hosts', type=int, default=50)
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--files', type=int, default=50)
+    parser.add_argument('--stations', type=int, default=10)
+    args = parser.parse_args()
+
+    box = MockFreebox(args.host, args.port, args.latency / 1000, args.jitter / 1000, args.hosts, args.calls,
+                      args.stations, files=args.files)
+    print('mock freebox on https://{0}:{1}/api/v3/, CA file {2}'.format(box.host, box.port, cert_file))
+    box.start()
+    try:
+        box._thread.join()
+    except KeyboardInterrupt:
+        box.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Load test of the client on recorded traffic, no box needed: the requests
+of a recording are sent again through Freepybox while ReplayTransport
+answers them from the same recording.
+    python benchmarks/replay.py traffic.jsonl.gz --repeat 100 --workers 16
+Without a recording, one is first made against the mock freebox:
+    python benchmarks/replay.py --repeat 100
+'''
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from freepybox.freepybox import Freepybox, app_desc
+from freepybox.replay import RecordingTransport, ReplayTransport, replay_traffic
+
+
+def record_mock(path, token_file):
+    '''
+    Record a polling session against the mock freebox
+    '''
+    from mock_freebox import MockFreebox
+
+    with MockFreebox(hosts=200, calls=1000, files=500) as box:
+        fbx = Freepybox(token_file=box.write_token_file(token_file), transport=RecordingTransport(path, box.transport()))
+        fbx.open(box.host, box.port)
+        fbx.system.get_config()
+        fbx.connection.get_status_details()
+        for port in fbx.switch.get_status():
+            fbx.switch.get_port_stats(port['id'])
+        fbx.wifi.get_station_list(0)
+        fbx.lan.get_hosts_list()
+        fbx.call.get_call_list()
+        fbx.fs.list_file('/Disque dur')
+        fbx.close()
+        fbx.session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='freepybox replay load test')
+    parser.add_argument('recording', nargs='?', help='recording file, made against the mock freebox if not given')
+    parser.add_argument('--repeat', type=int, default=20, help='times the recorded requests are sent')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--speed', type=float, help='pace of the recording multiplied by speed, as fast as possible if not given')
+    parser.add_argument('--codec', help='json codec: orjson, msgspec or json')
+    parser.add_argument('--cache', type=float, help='response cache TTL in seconds')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        recording = args.recording
+        if recording is None:
+            recording = os.path.join(tmp, 'traffic.jsonl.gz')
+            record_mock(recording, os.path.join(tmp, 'mock_auth'))
+
+        # Any application token does, the recorded login answers are replayed
+        token_file = os.path.join(tmp, 'replay_auth')
+        with open(token_file, 'w') as f:
+            json.dump({**app_desc, 'app_token': 'replay', 'track_id': 0}, f)
+
+        fbx = Freepybox(token_file=token_file, json_codec=args.codec, cache_ttl={'': args.cache} if args.cache else None,
+                        transport=ReplayTransport(recording, speed=args.speed))
+        fbx.open('replay', 443)
+        result = replay_traffic(fbx, recording, speed=args.speed, max_workers=args.workers, repeat=args.repeat)
+
+    print('{0} requests in {1:.2f}s: {2:.0f} req/s, {3} errors'.format(
+        result['requests'], result['elapsed'], result['rps'], result['errors']))
+    sys.exit(1 if result['errors'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Client benchmark suite run against the local mock freebox (mock_freebox.py),
+no real box needed:
+    open: open() latency with a new application, a new session and a reused session
+    rate: sequential requests per second and latency per endpoint
+    memory: memory allocated at peak and kept by the result, per call
+    scaling: throughput of fbx.batch for an increasing number of workers
+    transfer: ws/upload and dl/ throughput, for an increasing number of download parts
+    python benchmarks/suite.py --latency 2 --requests 200 --json results.json
+'''
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from freepybox.freepybox import Freepybox
+from mock_freebox import MockFreebox
+
+# Endpoints measured by the rate and memory benchmarks
+calls = [
+    ('system/', lambda fbx: fbx.system.get_config()),
+    ('switch/port/{id}/stats', lambda fbx: fbx.switch.get_port_stats(1)),
+    ('lan/browser/pub/', lambda fbx: fbx.lan.get_hosts_list()),
+    ('wifi/ap/{id}/stations/', lambda fbx: fbx.wifi.get_station_list(0)),
+    ('call/log/', lambda fbx: fbx.call.get_call_list()),
+    ('fs/ls/{id}', lambda fbx: fbx.fs.list_file('/Disque dur')),
+    ]
+
+
+def bench_open(box, tmp, runs):
+    '''
+    Returns the median open() time in ms and phases for each kind of open
+    '''
+    results = {}
+    kinds = (
+        ('new application', lambda path: None),
+        ('new session', lambda path: box.write_token_file(path)),
+        ('reused session', None),
+        )
+    for kind, prepare in kinds:
+        totals, phases = [], {}
+        for i in range(runs):
+            path = os.path.join(tmp, 'auth_{0}'.format(i))
+            if prepare is not None:
+                if os.path.exists(path):
+                    os.remove(path)
+                prepare(path)
+            fbx = Freepybox(token_file=path, transport=box.transport())
+            start = time.perf_counter()
+            fbx.open(box.host, box.port)
+            totals.append(time.perf_counter() - start)
+            for phase, seconds in fbx.open_timings.items():
+                phases.setdefault(phase, []).append(seconds)
+            fbx.close(logout=False)
+        results[kind] = {'ms': statistics.median(totals) * 1000,
+                         'phases_ms': {k: statistics.median(v) * 1000 for k, v in phases.items()}}
+    return results
+
+
+def bench_rate(fbx, requests):
+    '''
+    Returns requests per second and median latency in ms of sequential calls per endpoint
+    '''
+    results = {}
+    for name, call in calls:
+        call(fbx)
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(requests):
+            t = time.perf_counter()
+            call(fbx)
+            latencies.append(time.perf_counter() - t)
+        elapsed = time.perf_counter() - start
+        results[name] = {'rps': requests / elapsed, 'p50_ms': statistics.median(latencies) * 1000,
+                         'max_ms': max(latencies) * 1000}
+    return results
+
+
+def bench_memory(fbx):
+    '''
+    Returns the peak memory allocated during a call and the memory kept by its result, in kB
+    '''
+    results = {}
+    for name, call in calls:
+        call(fbx)
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        result = call(fbx)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = {'peak_kb': (peak - before) / 1024, 'kept_kb': (current - before) / 1024}
+        del result
+    return results
+
+
+def bench_scaling(fbx, requests, workers):
+    '''
+    Returns the requests per second of fbx.batch for each number of workers
+    '''
+    results = {}
+    batch = [(fbx.switch.get_port_stats, 1)] * requests
+    for n in workers:
+        start = time.perf_counter()
+        fbx.batch(batch, max_workers=n)
+        results[n] = requests / (time.perf_counter() - start)
+    return results
+
+
+def bench_transfer(fbx, tmp, size, parts):
+    '''
+    Returns the MB/s of a ws/upload of size bytes, and of its download for each number of parts
+    '''
+    local = os.path.join(tmp, 'transfer.bin')
+    with open(local, 'wb') as f:
+        f.write(os.urandom(size))
+    start = time.perf_counter()
+    fbx.fs.upload(local, '/Disque dur')
+    results = {'upload': size / (time.perf_counter() - start) / 1e6, 'download': {}}
+
+    dest = os.path.join(tmp, 'transfer.dl')
+    for n in parts:
+        start = time.perf_counter()
+        fbx.fs.download('/Disque dur/transfer.bin', dest, parts=n)
+        results['download'][n] = size / (time.perf_counter() - start) / 1e6
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='freepybox client benchmarks on a mock freebox')
+    parser.add_argument('--latency', type=float, default=2, help='mock answer latency in ms')
+    parser.add_argument('--hosts', type=int, default=200)
+    parser.add_argument('--calls', type=int, default=1000)
+    parser.add_argument('--files', type=int, default=500)
+    parser.add_argument('--runs', type=int, default=10, help='open() runs')
+    parser.add_argument('--requests', type=int, default=100, help='requests per endpoint')
+    parser.add_argument('--workers', default='1,2,4,8,16,32')
+    parser.add_argument('--transfer-size', type=float, default=32, help='size of the transferred file in MB')
+    parser.add_argument('--parts', default='1,2,4', help='download parts')
+    parser.add_argument('--only', help='comma separated benchmarks: open,rate,memory,scaling,transfer')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    only = set(args.only.split(',')) if args.only else {'open', 'rate', 'memory', 'scaling', 'transfer'}
+    workers = [int(n) for n in args.workers.split(',')]
+    results = {'latency_ms': args.latency}
+
+    with MockFreebox(latency=args.latency / 1000, hosts=args.hosts, calls=args.calls, files=args.files) as box, \
+            tempfile.TemporaryDirectory() as tmp:
+
+        if 'open' in only:
+            results['open'] = bench_open(box, tmp, args.runs)
+            print('open()')
+            for kind, r in results['open'].items():
+                phases = ', '.join('{0} {1:.1f}'.format(k, v) for k, v in r['phases_ms'].items() if k != 'total')
+                print('  {0:<16} {1:8.1f} ms  ({2})'.format(kind, r['ms'], phases))
+
+        fbx = Freepybox(token_file=box.write_token_file(os.path.join(tmp, 'auth')),
+                        transport=box.transport(pool_maxsize=max(workers)))
+        fbx.open(box.host, box.port)
+
+        if 'rate' in only:
+            results['rate'] = bench_rate(fbx, args.requests)
+            print('sequential requests')
+            for name, r in results['rate'].items():
+                print('  {0:<24} {1:8.0f} req/s  p50 {2:6.2f} ms  max {3:6.2f} ms'.format(name, r['rps'], r['p50_ms'], r['max_ms']))
+
+        if 'memory' in only:
+            results['memory'] = bench_memory(fbx)
+            print('memory per call')
+            for name, r in results['memory'].items():
+                print('  {0:<24} peak {1:9.1f} kB  kept {2:9.1f} kB'.format(name, r['peak_kb'], r['kept_kb']))
+
+        if 'scaling' in only:
+            results['scaling'] = bench_scaling(fbx, args.requests * 4, workers)
+            print('concurrency scaling (fbx.batch)')
+            base = results['scaling'][workers[0]]
+            for n, rps in results['scaling'].items():
+                print('  {0:>3} workers {1:8.0f} req/s  x{2:.1f}'.format(n, rps, rps / base))
+
+        if 'transfer' in only:
+            parts = [int(n) for n in args.parts.split(',')]
+            results['transfer'] = bench_transfer(fbx, tmp, int(args.transfer_size * 1e6), parts)
+            print('transfer')
+            print('  {0:<24} {1:8.1f} MB/s'.format('upload', results['transfer']['upload']))
+            for n, rate in results['transfer']['download'].items():
+                print('  {0:<24} {1:8.1f} MB/s'.format('download parts={0}'.format(n), rate))
+
+        fbx.close()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
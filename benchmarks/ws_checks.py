@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Checks of the websocket APIs against the local mock freebox (mock_freebox.py),
+no real box needed:
+    event: notifications, reconnect after a dropped connection, session
+        renewal on a refused handshake, refusal limit, stop() at once
+    upload: ws/upload of new and existing files, resume after a dropped
+        connection, and the uploaded files downloaded back in parallel
+    download: resumed downloads only continue a partial file of the
+        current remote file, other local files are overwritten
+    python benchmarks/ws_checks.py
+Exits with status 1 when a check fails.
+'''
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from freepybox.freepybox import Freepybox
+from freepybox.async_freepybox import AsyncFreepybox
+from freepybox.access import Access
+from freepybox.api.event import Event
+from freepybox.exceptions import *
+from mock_freebox import MockFreebox
+
+event_name = 'lan_host_l3addr_reachable'
+
+
+def wait_for(condition, timeout=5):
+    '''
+    Wait for condition() to be true, raise AssertionError after timeout seconds
+    '''
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out')
+        time.sleep(0.01)
+
+
+class Notifications:
+    '''
+    Callback of a subscription keeping the received notifications
+    '''
+    def __init__(self):
+        self.received = []
+        self._lock = threading.Lock()
+
+
+    def __call__(self, notification):
+        with self._lock:
+            self.received.append(notification)
+
+
+    def expect(self, box, result):
+        '''
+        Push a notification once subscribed and wait for it
+        '''
+        wait_for(lambda: box.subscribers(event_name) == 1)
+        box.notify(event_name, result)
+        wait_for(lambda: any(n['result'] == result for n in self.received))
+
+
+def check_event(box, tmp):
+    fbx = Freepybox(token_file=box.write_token_file(os.path.join(tmp, 'event_auth')), transport=box.transport())
+    fbx.open(box.host, box.port)
+    notifications = Notifications()
+    sub = fbx.event.subscribe([event_name], notifications, reconnect_delay=0.05)
+    try:
+        notifications.expect(box, {'step': 'registered'})
+        assert notifications.received[0]['source'] == 'lan' and notifications.received[0]['event'] == 'host_l3addr_reachable'
+
+        # Dropped connection: the websocket is reopened and registered again
+        box.drop_websockets()
+        notifications.expect(box, {'step': 'reconnected'})
+
+        # Expired session: the refused handshake renews the session
+        token = fbx._access.header['X-Fbx-App-Auth']
+        box.expire_sessions()
+        box.drop_websockets()
+        notifications.expect(box, {'step': 'renewed'})
+        assert fbx._access.header['X-Fbx-App-Auth'] != token, 'session not renewed'
+    finally:
+        sub.stop()
+    assert not sub.is_alive()
+
+    # stop() right after subscribe() does not hang
+    sub = fbx.event.subscribe([event_name], notifications)
+    stopper = threading.Thread(target=sub.stop, daemon=True)
+    stopper.start()
+    stopper.join(5)
+    assert not stopper.is_alive(), 'stop() hangs'
+    fbx.close()
+
+
+def check_event_refusals(box, tmp):
+    # Without session renewal, the handshake keeps being refused
+    box.requests['ws/event'] = 0
+    access = Access(None, 'https://{0}:{1}/api/v8/'.format(box.host, box.port), 'expired', 10)
+    access.session = box.transport().create_session(None)
+
+    async def listen():
+        async for notification in Event(access).listen([event_name], reconnect_delay=0.01, max_refusals=3):
+            pass
+
+    try:
+        asyncio.run(listen())
+        raise AssertionError('no AuthorizationError')
+    except AuthorizationError:
+        pass
+    assert box.requests['ws/event'] == 3, '{0} handshakes'.format(box.requests['ws/event'])
+
+
+def check_event_async(box, tmp):
+    async def run():
+        fbx = AsyncFreepybox(token_file=box.write_token_file(os.path.join(tmp, 'event_async_auth')), transport=box.transport())
+        await fbx.open(box.host, box.port)
+        listener = fbx.event.listen([event_name])
+        try:
+            first = asyncio.ensure_future(listener.__anext__())
+            while not box.subscribers(event_name):
+                await asyncio.sleep(0.01)
+            box.notify(event_name, {'step': 'async'})
+            notification = await asyncio.wait_for(first, 5)
+            assert notification['result'] == {'step': 'async'}
+        finally:
+            await listener.aclose()
+            await fbx.close()
+
+    asyncio.run(run())
+
+
+def check_upload(box, tmp):
+    fbx = Freepybox(token_file=box.write_token_file(os.path.join(tmp, 'upload_auth')), transport=box.transport())
+    fbx.open(box.host, box.port)
+    local = os.path.join(tmp, 'upload.bin')
+    content = os.urandom(3 * 1024 * 1024 + 7)
+    with open(local, 'wb') as f:
+        f.write(content)
+
+    assert fbx.fs.upload(local, '/Disque dur', chunk_size=256 * 1024) == len(content)
+    assert box.uploads['/Disque dur/upload.bin'] == content
+    assert fbx.fs.get_file_info('/Disque dur/upload.bin')['size'] == len(content)
+
+    # Dropped connection: the upload resumes from the bytes received
+    box.requests['ws/upload'] = 0
+    box.upload_drop_at = 1024 * 1024
+    fbx.fs.upload(local, '/Disque dur', 'resumed.bin', chunk_size=256 * 1024)
+    assert box.uploads['/Disque dur/resumed.bin'] == content
+    assert box.requests['ws/upload'] == 2, '{0} websockets'.format(box.requests['ws/upload'])
+
+    # An older file of the same name is overwritten, even when the first
+    # handshake is refused on an expired session
+    box.uploads['/Disque dur/old.bin'] = bytearray(b'old' * 1000)
+    box.expire_sessions()
+    fbx.fs.upload(local, '/Disque dur', 'old.bin', chunk_size=256 * 1024)
+    assert box.uploads['/Disque dur/old.bin'] == content, 'older file not overwritten'
+
+    # Parallel downloads of the uploaded and of an empty file
+    dest = os.path.join(tmp, 'download.bin')
+    assert fbx.fs.download('/Disque dur/upload.bin', dest, parts=4) == len(content)
+    with open(dest, 'rb') as f:
+        assert f.read() == content
+    box.uploads['/Disque dur/empty.bin'] = bytearray()
+    assert fbx.fs.download('/Disque dur/empty.bin', dest, parts=4) == 0
+    assert os.path.getsize(dest) == 0
+    fbx.close()
+
+
+def check_download(box, tmp):
+    fbx = Freepybox(token_file=box.write_token_file(os.path.join(tmp, 'download_auth')), transport=box.transport())
+    fbx.open(box.host, box.port)
+    content = os.urandom(300 * 1024)
+    box.uploads['/Disque dur/file.bin'] = bytearray(content)
+    box.upload_times['/Disque dur/file.bin'] = 1700001000
+    dest = os.path.join(tmp, 'file.bin')
+
+    def check(expected_written, **kwargs):
+        written = fbx.fs.download('/Disque dur/file.bin', dest, chunk_size=64 * 1024, **kwargs)
+        assert written == expected_written, '{0} bytes written'.format(written)
+        with open(dest, 'rb') as f:
+            assert f.read() == content, 'corrupt download'
+        assert not os.path.exists(dest + '.part')
+
+    # Older local files, smaller or of the same size, are overwritten
+    for old in (b'OLD' * 1000, os.urandom(len(content))):
+        with open(dest, 'wb') as f:
+            f.write(old)
+        check(len(content), resume=True)
+
+    # The part of an interrupted download is continued
+    def interrupted(data, modification=1700001000):
+        with open(dest + '.part', 'wb') as f:
+            f.write(data)
+        os.utime(dest + '.part', (modification, modification))
+
+    interrupted(content[:100000])
+    check(len(content) - 100000, resume=True)
+    interrupted(content)
+    check(0, resume=True)
+
+    # Without resume, or when the part is not one of the current remote
+    # file, the download starts over
+    interrupted(content[:100000])
+    check(len(content))
+    interrupted(content[:100000], modification=1700000000)
+    check(len(content), resume=True)
+    interrupted(content + b'more')
+    check(len(content), resume=True)
+
+    # A range on a file changed since fs/info gets the whole file
+    with fbx.fs._dl('/Disque dur/file.bin', 1000, if_range=1700000000) as r:
+        assert r.status_code == 200 and r.content == content
+    fbx.close()
+
+
+def check_upload_async(box, tmp):
+    local = os.path.join(tmp, 'upload_async.bin')
+    content = os.urandom(512 * 1024)
+    with open(local, 'wb') as f:
+        f.write(content)
+
+    async def run():
+        fbx = AsyncFreepybox(token_file=box.write_token_file(os.path.join(tmp, 'upload_async_auth')), transport=box.transport())
+        await fbx.open(box.host, box.port)
+        try:
+            await fbx.fs.upload_async(local, '/Disque dur', chunk_size=64 * 1024)
+        finally:
+            await fbx.close()
+
+    asyncio.run(run())
+    assert box.uploads['/Disque dur/upload_async.bin'] == content
+
+
+checks = {
+    'event': check_event,
+    'event_refusals': check_event_refusals,
+    'event_async': check_event_async,
+    'upload': check_upload,
+    'download': check_download,
+    'upload_async': check_upload_async,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='freepybox websocket checks on a mock freebox')
+    parser.add_argument('--only', help='comma separated checks: ' + ','.join(checks))
+    args = parser.parse_args()
+
+    failed = 0
+    with MockFreebox() as box, tempfile.TemporaryDirectory() as tmp:
+        for name, check in checks.items():
+            if args.only and name not in args.only.split(','):
+                continue
+            try:
+                check(box, tmp)
+                print('  {0:<16} ok'.format(name))
+            except Exception as e:
+                failed += 1
+                print('  {0:<16} FAILED {1!r}'.format(name, e))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -31,24 +31,35 @@ print('Informations générales :');
 print('========================');
 print('');
 
-fbx_config = fbx.system.get_config()
-fbx_connection_status_details = fbx.connection.get_status_details()
-fbx_connection_logs = fbx.connection.get_logs()
-fbx_connection_config = fbx.connection.get_config()
-fbx_ipv6 = fbx.connection.get_ipv6_config()
-fbx_dhcp_config = fbx.dhcp.get_config()
-fbx_phone = fbx.phone.get_config();
-fbx_wifi = fbx.wifi.get_global_config();
-fbx_wifi_ap = fbx.wifi.get_ap(0);
-fbx_bss = fbx.wifi.get_bss_list();
-lan_config = fbx.lan.get_config();
-dmz_config = fbx.fw.get_dmz_config();
-fbx_static_dhcp = fbx.dhcp.get_static_dhcp_lease();
-fbx_dyn_dhcp = fbx.dhcp.get_dynamic_dhcp_lease();
-fbx_ports = fbx.fw.get_forward()
-fbx_switch_status = fbx.switch.get_status()
-fbx_media = fbx.airmedia.get_config()
-fbx_freeplugs = fbx.freeplugs.get_freeplugs_list()
+# Fetch everything in parallel, one round-trip of wall time
+results = fbx.batch([
+    fbx.system.get_config,
+    fbx.connection.get_status_details,
+    fbx.connection.get_logs,
+    fbx.connection.get_config,
+    fbx.connection.get_ipv6_config,
+    fbx.dhcp.get_config,
+    fbx.phone.get_config,
+    fbx.wifi.get_global_config,
+    (fbx.wifi.get_ap, 0),
+    fbx.wifi.get_bss_list,
+    fbx.lan.get_config,
+    fbx.fw.get_dmz_config,
+    fbx.dhcp.get_static_dhcp_lease,
+    fbx.dhcp.get_dynamic_dhcp_lease,
+    fbx.fw.get_forward,
+    fbx.switch.get_status,
+    fbx.airmedia.get_config,
+    fbx.freeplugs.get_freeplugs_list,
+    ])
+for r in results:
+    if isinstance(r, Exception):
+        raise r
+(fbx_config, fbx_connection_status_details, fbx_connection_logs,
+ fbx_connection_config, fbx_ipv6, fbx_dhcp_config, fbx_phone, fbx_wifi,
+ fbx_wifi_ap, fbx_bss, lan_config, dmz_config, fbx_static_dhcp,
+ fbx_dyn_dhcp, fbx_ports, fbx_switch_status, fbx_media,
+ fbx_freeplugs) = results
 
 print('  Modèle                         {0}'.format(fbx_config['board_name']));
 print('  Version du firmware            {0}'.format(fbx_config['firmware_version']));
@@ -355,12 +366,12 @@ print('                         Lien           Débit entrant            Débit
 print('                         --             --                       --');
 
 # Mise a jour des debits tous en meme temps pour qu ils correspondent... mais ca ne fonctionne pas..!
-stats = [None] * len(fbx_switch_status);
-index = 0
-while index < len(fbx_switch_status):
-    stats[index] = fbx.switch.get_port_stats(fbx_switch_status[index]['id'])
-    index += 1;
-fbx_connection_status_details = fbx.connection.get_status_details()
+results = fbx.batch([(fbx.switch.get_port_stats, port['id']) for port in fbx_switch_status] + [fbx.connection.get_status_details])
+for r in results:
+    if isinstance(r, Exception):
+        raise r
+stats = results[:-1]
+fbx_connection_status_details = results[-1]
 
 rx = fbx_connection_status_details['rate_down']/1024
 rxb = rx*8/1024
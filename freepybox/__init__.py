@@ -8,4 +8,18 @@ Freebox API documentation : http://dev.freebox.fr/sdk/os/
 __version__ = '0.0.2'
 __all__ = ['freepybox']
 
-from freepybox.freepybox import Freepybox
+
+def __getattr__(name):
+    '''
+    Import the client classes on first use to keep "import freepybox" fast
+    '''
+    if name == 'Freepybox':
+        from freepybox.freepybox import Freepybox
+        return Freepybox
+    if name == 'AsyncFreepybox':
+        from freepybox.async_freepybox import AsyncFreepybox
+        return AsyncFreepybox
+    if name == 'FreeboxFleet':
+        from freepybox.fleet import FreeboxFleet
+        return FreeboxFleet
+    raise AttributeError("module 'freepybox' has no attribute '{0}'".format(name))
@@ -1,59 +1,238 @@
-import requests
-import json
+import contextvars
+import threading
+import time
 from urllib.parse import urljoin
 from freepybox.exceptions import *
+from freepybox.retry import is_box_failure
+from freepybox.codec import JsonCodec
+from freepybox.instrument import before_request, after_request
+
+# Error codes returned by the freebox when the session token is no longer valid
+session_error_codes = ('auth_required', 'invalid_session')
+
+# Monotonic time at which the requests of the current context give up, set
+# by FreeboxFleet.run() for the call of each box
+request_deadline = contextvars.ContextVar('freepybox_request_deadline', default=None)
+
+
+def require_blocking(access, name):
+    '''
+    Raise TypeError when access is an AsyncAccess, name being a helper
+    only available with the blocking Freepybox
+    '''
+    from freepybox.async_access import AsyncAccess
+    if isinstance(access, AsyncAccess):
+        raise TypeError('{0} is only available with the blocking Freepybox'.format(name))
+
 
 class Access:
-    def __init__(self, session, base_url, session_token, http_timeout):
+    def __init__(self, session, base_url, session_token, http_timeout, renew_session=None, cache=None, retry=None, breaker=None, limiter=None, codec=None, hooks=None):
         self.session = session
         self.header = {'X-Fbx-App-Auth': session_token}
         self.base_url = base_url
         self.timeout = http_timeout
+        self.renew_session = renew_session
+        self.cache = cache
+        self.retry = retry
+        self.breaker = breaker
+        self.limiter = limiter
+        self.codec = codec or JsonCodec()
+        # Objects with before_request(info) and/or after_request(info) methods
+        self.hooks = list(hooks or [])
+        self._renew_lock = threading.Lock()
 
 
     def get(self, end_url):
         '''
         Send get request and return results
         '''
-        url = urljoin(self.base_url, end_url)
-        r = self.session.get(url, headers=self.header, timeout=self.timeout)
-        resp = r.json()
-
-        if resp['success'] != True:
-            raise HttpRequestError(resp['error_code'])
-
-        if 'result' in resp:
-            return resp['result']
+        return self._request('GET', end_url)
 
 
     def post(self, end_url, payload=None):
         '''
         Send post request and return results
         '''
+        return self._request('POST', end_url, payload)
+
+
+    def put(self, end_url, payload=None):
+        '''
+        Send put request and return results
+        '''
+        return self._request('PUT', end_url, payload)
+
+
+    def delete(self, end_url):
+        '''
+        Send delete request and return results
+        '''
+        return self._request('DELETE', end_url)
+
+
+    def _request(self, method, end_url, payload=None):
+        '''
+        Send the request and return results.
+        When the session has expired, the session token is renewed
+        with the renew_session callback and the request is sent again once.
+        GET results are served from the cache when there is one, other
+        methods invalidate the cached entries under end_url.
+        '''
+        if method == 'GET' and self.cache is not None:
+            hit, result = self.cache.lookup(end_url)
+            if hit:
+                return result
+
         url = urljoin(self.base_url, end_url)
-        data = json.dumps(payload) if payload is not None else None
-        r = self.session.post(url, headers=self.header, data=data, timeout=self.timeout)
-        resp = r.json()
+        data = self.codec.dumps(payload) if payload is not None else None
+        header = self.header
+        resp = self._send_retry(method, end_url, url, data, header)
+
+        if resp.get('error_code') in session_error_codes and self.renew_session is not None:
+            header = self._renew_header(header)
+            resp = self._send_retry(method, end_url, url, data, header)
+
+        if method != 'GET' and self.cache is not None:
+            self.cache.invalidate(end_url)
 
         if resp['success'] != True:
             raise HttpRequestError(resp['error_code'])
 
+        if method == 'GET' and self.cache is not None:
+            self.cache.store(end_url, resp.get('result'))
+
         if 'result' in resp:
             return resp['result']
 
 
-    def put(self, end_url, payload=None):
+    def stream(self, end_url, headers=None):
         '''
-        Send post request and return results
+        Send get request on an endpoint returning raw content (dl/...)
+        and return the requests response with its body not read yet
         '''
         url = urljoin(self.base_url, end_url)
-        data = json.dumps(payload) if payload is not None else None
-        r = self.session.put(url, headers=self.header, data=data, timeout=self.timeout)
-        resp = r.json()
+        header = self.header
+        if self.limiter is not None:
+            self.limiter.acquire(end_url)
+        r = self.session.get(url, headers={**header, **(headers or {})}, timeout=self._request_timeout(), stream=True)
 
-        if resp['success'] != True:
-            raise HttpRequestError(resp['error_code'])
+        if r.status_code in (401, 403) and self.renew_session is not None:
+            r.close()
+            header = self._renew_header(header)
+            r = self.session.get(url, headers={**header, **(headers or {})}, timeout=self._request_timeout(), stream=True)
+
+        if r.status_code >= 400 and r.status_code != 416:
+            try:
+                error_code = r.json().get('error_code', r.status_code)
+            except ValueError:
+                error_code = r.status_code
+            r.close()
+            raise HttpRequestError(error_code)
+
+        return r
+
+
+    def _renew_header(self, failed_header):
+        '''
+        Return the header of a renewed session. Threads failing on the same
+        expired session wait for a single login and share its new token.
+        '''
+        with self._renew_lock:
+            if self.header is failed_header:
+                self.header = {'X-Fbx-App-Auth': self.renew_session()}
+            return self.header
+
+
+    def _request_timeout(self):
+        '''
+        Returns the http timeout of a request, shortened to the time left
+        before the request deadline of the context. Raise TimeoutError
+        once the deadline has passed.
+        '''
+        deadline = request_deadline.get()
+        if deadline is None:
+            return self.timeout
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise TimeoutError('request deadline exceeded')
+        return left if self.timeout is None else min(self.timeout, left)
+
+
+    def _send_retry(self, method, end_url, url, data, header):
+        '''
+        Send the request, idempotent requests failing on a network or
+        server error are sent again with backoff
+        '''
+        attempt = 0
+        while True:
+            # Past the request deadline, fail without retrying
+            timeout = self._request_timeout()
+            try:
+                return self._send_once(method, end_url, url, data, header, timeout)
+            except Exception as e:
+                if self.retry is None or not self.retry.should_retry(method, attempt, e):
+                    raise
+            time.sleep(self.retry.delay(attempt))
+            attempt += 1
+
+
+    def _send_once(self, method, end_url, url, data, header, timeout):
+        '''
+        Send the request once through the circuit breaker, the rate limiter
+        and the hooks
+        '''
+        trial = self.breaker is not None and self.breaker.before_request()
+        try:
+            if self.limiter is not None:
+                self.limiter.acquire(end_url)
+            info = before_request(self.hooks, method, end_url, data) if self.hooks else None
+            try:
+                resp = self._send(method, url, data, header, timeout, info)
+            except Exception as e:
+                if info is not None:
+                    after_request(self.hooks, info, type(e).__name__)
+                # A timeout shortened by the request deadline says nothing of the box
+                if self.breaker is not None and is_box_failure(e) and timeout == self.timeout:
+                    self.breaker.record_failure()
+                raise
+
+            if info is not None:
+                after_request(self.hooks, info, None if resp.get('success') else resp.get('error_code'))
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return resp
+        finally:
+            # A trial ending without an answer (cancelled, failing hook...)
+            # must not leave the breaker open forever
+            if trial:
+                self.breaker.end_trial()
+
+
+    def _send(self, method, url, data, header, timeout, info=None):
+        '''
+        Send the request on the http session and return the json body
+        decoded from bytes by the codec, info is completed for the hooks.
+        A 5xx status raises ServerError with the freebox error_code and
+        msg when the body has them.
+        '''
+        r = self.session.request(method, url, headers=header, data=data, timeout=timeout)
+        if info is not None:
+            info.status = r.status_code
+            info.response_size = len(r.content)
+        return decode_response(self.codec, r.status_code, r.content)
 
-        if 'result' in resp:
-            return resp['result']
 
+def decode_response(codec, status, body):
+    '''
+    Returns the json body of a freebox answer decoded by codec, raise
+    ServerError on a 5xx status or a non json body
+    '''
+    try:
+        resp = codec.loads(body)
+    except ValueError:
+        raise ServerError(status)
+    if status >= 500:
+        if isinstance(resp, dict) and resp.get('error_code'):
+            raise ServerError(resp['error_code'], resp.get('msg', ''))
+        raise ServerError(status)
+    return resp
@@ -15,4 +15,4 @@ class Airmedia:
         '''
         Update Airmedia configuration with conf dictionary
         '''
-        self._access.put('airmedia/config/', conf)
+        return self._access.put('airmedia/config/', conf)
@@ -1,7 +1,11 @@
+from freepybox.access import require_blocking
+from freepybox.batch import run_batch
+
 class Call:
 
     def __init__(self, access):
         self._access = access
+        self.store = None
 
 
     def get_call_list(self):
@@ -10,3 +14,76 @@ class Call:
         '''
         return self._access.get('call/log/')
 
+
+    def sync(self, db_path='calls.db'):
+        '''
+        Bring the local call store of db_path up to date and returns the
+        call entries received since the previous sync, oldest first.
+        The box has no incremental query, the log is fetched and only the
+        entries above the stored id or date are written to the store, next
+        to the older ones when the box ids started over.
+            new_calls = fbx.call.sync('calls.db')
+            fbx.call.store.calls(new=True)
+        '''
+        require_blocking(self._access, 'Call.sync()')
+        if self.store is None or self.store.db_path != db_path:
+            from freepybox.api.callstore import CallStore
+            if self.store is not None:
+                self.store.close()
+            self.store = CallStore(db_path)
+
+        last_id, last_datetime = self.store.watermark()
+        # The date also catches the calls of a box whose ids started over
+        new_calls = sorted((e for e in self.get_call_list() or []
+                            if e['id'] > last_id or e.get('datetime', 0) > last_datetime),
+                           key=lambda e: (e.get('datetime', 0), e['id']))
+        if new_calls:
+            self.store.add(new_calls)
+        return new_calls
+
+
+    def mark_read(self, ids, max_workers=8):
+        '''
+        Mark the calls with the given ids as read, the requests are sent concurrently.
+        Returns the results in the ids order, a failing call gives its exception.
+        '''
+        require_blocking(self._access, 'Call.mark_read()')
+        ids = list(ids)
+        results = run_batch([(self._access.put, 'call/log/{0}'.format(i), {'new': False}) for i in ids], max_workers)
+        if self.store is not None:
+            self.store.mark_read([i for i, r in zip(ids, results) if not isinstance(r, Exception)])
+        return results
+
+
+    def mark_all_read(self):
+        '''
+        Mark all the calls as read
+        '''
+        result = self._access.post('call/log/mark_all_as_read/')
+        if self.store is not None:
+            self.store.mark_read()
+        return result
+
+
+    def delete(self, ids, max_workers=8):
+        '''
+        Delete the calls with the given ids from the box and the local store,
+        the requests are sent concurrently.
+        Returns the results in the ids order, a failing call gives its exception.
+        '''
+        require_blocking(self._access, 'Call.delete()')
+        ids = list(ids)
+        results = run_batch([(self._access.delete, 'call/log/{0}'.format(i)) for i in ids], max_workers)
+        if self.store is not None:
+            self.store.delete([i for i, r in zip(ids, results) if not isinstance(r, Exception)])
+        return results
+
+
+    def delete_all(self):
+        '''
+        Delete all the calls from the box and the local store
+        '''
+        result = self._access.post('call/log/delete_all/')
+        if self.store is not None:
+            self.store.delete()
+        return result
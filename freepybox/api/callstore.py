@@ -0,0 +1,118 @@
+import json
+import sqlite3
+import threading
+
+# Row of the most recent stored call with a given box id
+_latest_rowid = 'SELECT rowid FROM calls WHERE id = ? ORDER BY datetime DESC LIMIT 1'
+
+class CallStore:
+    '''
+    Local SQLite store of the call log entries, keyed by call id, date
+    and number: the box starts its ids over when its log is cleared, the
+    new calls are then stored next to the old ones of the same ids.
+    It keeps the highest id and date seen so that a sync only writes
+    the new entries, and the history outlives the box log rotation.
+    '''
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS calls (
+                id INTEGER NOT NULL,
+                datetime INTEGER NOT NULL,
+                type TEXT,
+                number TEXT NOT NULL,
+                name TEXT,
+                duration INTEGER,
+                new INTEGER NOT NULL,
+                entry TEXT NOT NULL,
+                UNIQUE (id, datetime, number)
+            );
+            CREATE INDEX IF NOT EXISTS calls_datetime ON calls (datetime);
+            CREATE INDEX IF NOT EXISTS calls_new ON calls (new);
+            ''')
+
+
+    def close(self):
+        '''
+        Close the store database
+        '''
+        self._db.close()
+
+
+    def watermark(self):
+        '''
+        Returns (highest id, highest date) of the stored calls
+        '''
+        with self._lock:
+            row = self._db.execute('SELECT COALESCE(MAX(id), 0), COALESCE(MAX(datetime), 0) FROM calls').fetchone()
+        return row[0], row[1]
+
+
+    def add(self, entries):
+        '''
+        Store call log entries, replacing the stored ones with the same id,
+        date and number
+        '''
+        rows = [(e['id'], e.get('datetime', 0), e.get('type'), e.get('number') or '', e.get('name'),
+                 e.get('duration'), int(bool(e.get('new'))), json.dumps(e)) for e in entries]
+        with self._lock, self._db:
+            self._db.executemany('INSERT OR REPLACE INTO calls VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+
+    def mark_read(self, ids=None):
+        '''
+        Mark the calls with the given box ids as read, all the calls with
+        ids=None. An id designates the most recent stored call with that id.
+        '''
+        with self._lock, self._db:
+            if ids is None:
+                self._db.execute('UPDATE calls SET new = 0 WHERE new = 1')
+            else:
+                self._db.executemany('UPDATE calls SET new = 0 WHERE rowid = ({0})'.format(_latest_rowid),
+                                     [(i,) for i in ids])
+
+
+    def delete(self, ids=None):
+        '''
+        Remove the calls with the given box ids, all the calls with ids=None.
+        An id designates the most recent stored call with that id.
+        '''
+        with self._lock, self._db:
+            if ids is None:
+                self._db.execute('DELETE FROM calls')
+            else:
+                self._db.executemany('DELETE FROM calls WHERE rowid = ({0})'.format(_latest_rowid),
+                                     [(i,) for i in ids])
+
+
+    def calls(self, since=None, new=None, number=None, limit=None):
+        '''
+        Returns the stored call log entries, the most recent first:
+            since: only the calls from this timestamp
+            new: True for the unread calls, False for the read ones
+            number: only the calls from or to this number
+        '''
+        clauses, args = [], []
+        if since is not None:
+            clauses.append('datetime >= ?')
+            args.append(since)
+        if new is not None:
+            clauses.append('new = ?')
+            args.append(int(new))
+        if number is not None:
+            clauses.append('number = ?')
+            args.append(number)
+
+        query = 'SELECT entry, new FROM calls'
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        query += ' ORDER BY datetime DESC, id DESC'
+        if limit is not None:
+            query += ' LIMIT ?'
+            args.append(limit)
+        with self._lock:
+            rows = self._db.execute(query, args).fetchall()
+        return [{**json.loads(row['entry']), 'new': bool(row['new'])} for row in rows]
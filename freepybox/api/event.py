@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import threading
+from freepybox.exceptions import *
+from freepybox.ws import import_aiohttp, ws_url, ssl_context, ws_session, renew_header
+
+logger = logging.getLogger(__name__)
+
+class Event:
+    '''
+    Freebox OS push notifications over the ws/event websocket (API v8 or later).
+    Event names are "<source>_<event>", for example:
+        lan_host_l3addr_reachable, lan_host_l3addr_unreachable,
+        vm_state_changed, vm_disk_task_done
+    '''
+    def __init__(self, access):
+        self._access = access
+
+
+    async def listen(self, events, reconnect_delay=1, max_reconnect_delay=60, max_refusals=5):
+        '''
+        Async iterator over the notifications of the registered events.
+        The websocket is reopened with an exponential backoff when the
+        connection drops, and the session renewed when the handshake is
+        refused. AuthorizationError is raised after max_refusals refused
+        handshakes in a row.
+        '''
+        aiohttp = import_aiohttp()
+        delay = reconnect_delay
+        refusals = 0
+
+        async with ws_session(self._access) as session:
+            while True:
+                header = self._access.header
+                try:
+                    async with session.ws_connect(ws_url(self._access, 'ws/event'), headers=header,
+                                                  ssl=ssl_context(self._access), heartbeat=30) as ws:
+                        refusals = 0
+                        await ws.send_json({'action': 'register', 'events': list(events)})
+                        delay = reconnect_delay
+
+                        async for msg in ws:
+                            if msg.type != aiohttp.WSMsgType.TEXT:
+                                break
+                            data = msg.json()
+                            if data.get('action') == 'notification':
+                                yield data
+                            elif not data.get('success', True):
+                                raise HttpRequestError(data.get('error_code'))
+
+                except aiohttp.WSServerHandshakeError as e:
+                    if e.status not in (401, 403):
+                        logger.warning('ws/event handshake failed: {0}'.format(e))
+                    else:
+                        refusals += 1
+                        if refusals >= max_refusals:
+                            raise AuthorizationError('ws/event handshake refused {0} times'.format(refusals))
+                        logger.warning('ws/event handshake refused, renewing the session')
+                        await renew_header(self._access, header)
+
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.warning('ws/event connection lost: {0}'.format(e))
+
+                logger.info('ws/event reconnecting in {0}s'.format(delay))
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, max_reconnect_delay)
+
+
+    def subscribe(self, events, callback, **kwargs):
+        '''
+        Call callback(notification) for the registered events from a
+        background thread. Returns the EventSubscription thread, stop it
+        with its stop() method.
+        '''
+        subscription = EventSubscription(self, events, callback, **kwargs)
+        subscription.start()
+        return subscription
+
+
+class EventSubscription(threading.Thread):
+    '''
+    Background thread running an Event.listen() loop
+    '''
+    def __init__(self, event, events, callback, **kwargs):
+        threading.Thread.__init__(self, daemon=True)
+        self._event = event
+        self._events = events
+        self._callback = callback
+        self._kwargs = kwargs
+        self._loop = None
+        self._task = None
+        self._running = threading.Event()
+
+
+    def run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._task = self._loop.create_task(self._consume())
+            # Set from the running loop, stop() can then always cancel the task
+            self._loop.call_soon(self._running.set)
+            self._loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            logger.exception('ws/event subscription failed')
+        finally:
+            self._running.set()
+            self._loop.close()
+
+
+    def stop(self):
+        '''
+        Close the websocket and wait for the thread to finish
+        '''
+        self._running.wait()
+        try:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        except RuntimeError:
+            # The loop is already closed, the subscription has ended
+            pass
+        self.join()
+
+
+    async def _consume(self):
+        async for notification in self._event.listen(self._events, **self._kwargs):
+            try:
+                self._callback(notification)
+            except Exception:
+                logger.exception('event callback failed')
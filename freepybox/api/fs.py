@@ -1,6 +1,21 @@
+import asyncio
 import base64
+import collections
+import contextlib
+import contextvars
+import email.utils
+import inspect
+import mmap
 import os
+import posixpath
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from freepybox.exceptions import *
+from freepybox.access import require_blocking
+from freepybox.batch import run_batch
+from freepybox.ws import import_aiohttp, ws_url, ssl_context, ws_session, renew_header
 
 logger = logging.getLogger(__name__)
 
@@ -54,18 +69,512 @@ class Fs:
         return self._access.get('fs/tasks/')
 
 
-    def list_file(self, path):
+    def get_task(self, task_id):
+        '''
+        Return the task with the given id
+        '''
+        return self._access.get('fs/tasks/{0}'.format(task_id))
+
+
+    def delete_task(self, task_id):
+        '''
+        Delete the task with the given id from the tasks list
+        '''
+        return self._access.delete('fs/tasks/{0}'.format(task_id))
+
+
+    def copy(self, files, dst, mode='overwrite'):
+        '''
+        Copy one path or a list of paths to the dst folder in a single task.
+        mode is one of overwrite, both, skip, recent
+        Returns the FsTask
+        Only available with the blocking Freepybox.
+        '''
+        require_blocking(self._access, 'Fs.copy()')
+        return self._start_task('fs/cp/', {'files': self._encode_paths(files), 'dst': self._encode_path(dst), 'mode': mode})
+
+
+    def move(self, files, dst, mode='overwrite'):
+        '''
+        Move one path or a list of paths to the dst folder in a single task.
+        mode is one of overwrite, both, skip, recent
+        Returns the FsTask
+        Only available with the blocking Freepybox.
+        '''
+        require_blocking(self._access, 'Fs.move()')
+        return self._start_task('fs/mv/', {'files': self._encode_paths(files), 'dst': self._encode_path(dst), 'mode': mode})
+
+
+    def remove(self, files):
+        '''
+        Delete one path or a list of paths in a single task.
+        Returns the FsTask
+        Only available with the blocking Freepybox.
+        '''
+        require_blocking(self._access, 'Fs.remove()')
+        return self._start_task('fs/rm/', {'files': self._encode_paths(files)})
+
+
+    def archive(self, files, dst):
+        '''
+        Create the dst archive (.zip, .tar, .7z...) of one path or a list
+        of paths in a single task.
+        Returns the FsTask
+        Only available with the blocking Freepybox.
+        '''
+        require_blocking(self._access, 'Fs.archive()')
+        return self._start_task('fs/archive/', {'files': self._encode_paths(files), 'dst': self._encode_path(dst)})
+
+
+    def wait_all(self, tasks, timeout=None, interval=0.2, max_interval=5):
+        '''
+        Wait for all the tasks to be done or failed, checking them with a
+        single tasks list request per poll. The poll interval doubles up
+        to max_interval while tasks are still running.
+        Returns the tasks, check their state for failures.
+        Only available with the blocking Freepybox.
+        '''
+        require_blocking(self._access, 'Fs.wait_all()')
+        deadline = None if timeout is None else time.monotonic() + timeout
+        running = [t for t in tasks if not t.is_finished()]
+
+        while running:
+            infos = {t['id']: t for t in self.get_tasks_list() or []}
+            for task in running:
+                if task.id in infos:
+                    task.info = infos[task.id]
+                else:
+                    task.refresh()
+            running = [t for t in running if not t.is_finished()]
+            if not running:
+                break
+
+            if deadline is not None and time.monotonic() + interval > deadline:
+                raise TimeoutError('{0} fs tasks still running'.format(len(running)))
+            time.sleep(interval)
+            interval = min(interval * 2, max_interval)
+
+        return tasks
+
+
+    def _start_task(self, end_url, payload):
+        return FsTask(self, self._access.post(end_url, payload))
+
+
+    def _encode_path(self, path):
+        return base64.b64encode(path.encode('utf-8')).decode('utf-8')
+
+
+    def _encode_paths(self, paths):
+        if isinstance(paths, str):
+            paths = [paths]
+        return [self._encode_path(p) for p in paths]
+
+
+    def list_file(self, path, only_folder=False, remove_hidden=False, count_sub_folder=False):
         '''
         Returns the list of files for the given path
+            only_folder: only list folders
+            remove_hidden: do not list hidden files
+            count_sub_folder: return the number of sub folders of each folder
+        '''
+        path_b64 = self._encode_path(path)
+        options = [k for k, v in (('onlyFolder', only_folder), ('removeHidden', remove_hidden),
+                                  ('countSubFolder', count_sub_folder)) if v]
+        query = '?' + '&'.join('{0}=1'.format(k) for k in options) if options else ''
+        return self._access.get('fs/ls/{0}{1}'.format(path_b64, query))
+
+
+    def walk(self, root='/', max_workers=8, max_depth=None, filter=None, only_folder=False, remove_hidden=True, onerror=None):
         '''
-        path_b64 = base64.b64encode(path.encode('utf-8')).decode('utf-8')
-        return self._access.get('fs/ls/{0}'.format(path_b64))
+        Generator over the tree under root yielding (path, entry) for each
+        file and folder as soon as its directory listing arrives.
+        Directories are listed concurrently, at most max_workers at a time.
+            max_depth: 0 only lists root, None has no limit
+            filter(path, entry): return False to skip an entry and its sub tree
+            only_folder, remove_hidden: fs/ls options shrinking the listings
+            onerror(path, exception): called when a listing fails, the
+            exception is raised when onerror is None
+        Only available with the blocking Freepybox.
+        '''
+        require_blocking(self._access, 'Fs.walk()')
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        queue = collections.deque([(root, 0)])
+        pending = {}
+
+        try:
+            while queue or pending:
+                while queue and len(pending) < max_workers:
+                    path, depth = queue.popleft()
+                    future = executor.submit(contextvars.copy_context().run, self.list_file, path, only_folder, remove_hidden)
+                    pending[future] = (path, depth)
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    dirpath, depth = pending.pop(future)
+                    try:
+                        entries = future.result() or []
+                    except Exception as e:
+                        if onerror is None:
+                            raise
+                        onerror(dirpath, e)
+                        continue
+
+                    for entry in entries:
+                        if entry['name'] in ('.', '..'):
+                            continue
+                        path = posixpath.join(dirpath, entry['name'])
+                        if filter is not None and not filter(path, entry):
+                            continue
+                        yield path, entry
+                        if entry.get('type') == 'dir' and (max_depth is None or depth < max_depth):
+                            queue.append((path, depth + 1))
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
 
 
     def get_file_info(self, path):
         '''
         Returns informations for the given path
         '''
-        path_b64 = base64.b64encode(path.encode('utf-8')).decode('utf-8')
-        return self._access.get('fs/ls/{0}'.format(path_b64))
+        path_b64 = self._encode_path(path)
+        return self._access.get('fs/info/{0}'.format(path_b64))
+
+
+    def open_read(self, path, offset=0):
+        '''
+        Returns a binary file-like object streaming the content of the
+        file from offset. Close it to release the connection.
+        Only available with the blocking Freepybox.
+        '''
+        require_blocking(self._access, 'Fs.open_read()')
+        r = self._dl(path, offset)
+        if r.status_code == 416:
+            r.close()
+            raise HttpRequestError('range_not_satisfiable')
+        if offset and r.status_code != 206:
+            r.close()
+            raise HttpRequestError('range_not_supported')
+        r.raw.decode_content = True
+        return r.raw
+
+
+    def download(self, path, dest, chunk_size=1024*1024, resume=False, parts=1, progress=None):
+        '''
+        Download the file at path to dest in chunk_size chunks.
+        dest is a local file path or a writable binary file object.
+        When dest is a path, the file is written in dest.part, stamped with
+        the remote modification date, and renamed dest once complete:
+            resume: continue the dest.part of an interrupted download with
+            a HTTP Range request, when the remote file has not changed since
+            parts: number of byte ranges fetched in parallel, a parallel
+            download is not resumed and starts over
+        progress(bytes_written) is called after each chunk.
+        Returns the number of bytes written.
+        Only available with the blocking Freepybox.
+        '''
+        require_blocking(self._access, 'Fs.download()')
+        progress = self._progress_counter(progress)
+
+        if not isinstance(dest, (str, bytes, os.PathLike)):
+            return self._download_range(path, dest, 0, None, chunk_size, progress)
+
+        dest = os.fspath(dest)
+        part = dest + (b'.part' if isinstance(dest, bytes) else '.part')
+        info = self.get_file_info(path)
+        if parts > 1:
+            written = self._download_parallel(path, part, info['size'], chunk_size, parts, progress)
+        else:
+            written = self._download_resumable(path, part, info, chunk_size, resume, progress)
+        os.replace(part, dest)
+        return written
+
+
+    def _download_resumable(self, path, part, info, chunk_size, resume, progress):
+        '''
+        Download the file in part. With resume, an existing part is
+        continued when it holds the start of the current remote file: its
+        modification date is the one of fs/info and it is not larger.
+        '''
+        size, modification = info['size'], info.get('modification')
+        offset = 0
+        if resume and modification is not None and os.path.exists(part) \
+                and os.path.getmtime(part) == modification and os.path.getsize(part) <= size:
+            offset = os.path.getsize(part)
+            if offset == size:
+                return 0
+
+        r = self._dl(path, offset, if_range=modification)
+        # Range ignored, or the file changed since fs/info: start over
+        if offset and r.status_code == 200:
+            offset = 0
+        if r.status_code == 416:
+            r.close()
+            offset = 0
+            r = self._dl(path)
+
+        try:
+            with open(part, 'ab' if offset else 'wb') as f:
+                return self._write_chunks(r, f, chunk_size, progress)
+        finally:
+            # An interrupted part keeps the stamp checked by the next resume
+            if modification is not None and os.path.exists(part):
+                os.utime(part, (modification, modification))
+
+
+    def _download_parallel(self, path, dest, size, chunk_size, parts, progress):
+        '''
+        Download the file in parts byte ranges fetched in parallel, each
+        range being written in place in the preallocated dest file
+        '''
+        with open(dest, 'wb') as f:
+            f.truncate(size)
+        if size == 0:
+            return 0
+
+        part_size = -(-size // parts)
+        ranges = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+
+        def download_part(start, end):
+            with open(dest, 'r+b') as f:
+                f.seek(start)
+                return self._download_range(path, f, start, end, chunk_size, progress)
+
+        results = run_batch([(download_part, start, end) for start, end in ranges], parts)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return sum(results)
+
+
+    def _download_range(self, path, f, start, end, chunk_size, progress):
+        '''
+        Write bytes start to end (included, None for the end of the file) in f
+        '''
+        r = self._dl(path, start, end)
+        if (start or end is not None) and r.status_code != 206:
+            r.close()
+            raise HttpRequestError('range_not_supported')
+        return self._write_chunks(r, f, chunk_size, progress)
+
+
+    def _write_chunks(self, r, f, chunk_size, progress):
+        '''
+        Copy the body of the streamed response r in f chunk by chunk
+        '''
+        written = 0
+        with r:
+            for chunk in r.iter_content(chunk_size):
+                f.write(chunk)
+                written += len(chunk)
+                progress(len(chunk))
+        return written
+
+
+    def _progress_counter(self, progress):
+        '''
+        Returns a thread safe callback adding chunk sizes and
+        reporting the total to progress
+        '''
+        lock = threading.Lock()
+        total = [0]
+
+        def add(size):
+            with lock:
+                total[0] += size
+                if progress is not None:
+                    progress(total[0])
+        return add
+
+
+    def _dl(self, path, start=0, end=None, if_range=None):
+        '''
+        Returns the streamed response of the dl/ endpoint for a byte range.
+        if_range: modification date the range is only valid for, the whole
+        file is sent when it changed
+        '''
+        path_b64 = self._encode_path(path)
+        headers = None
+        if start or end is not None:
+            headers = {'Range': 'bytes={0}-{1}'.format(start, '' if end is None else end)}
+            if if_range is not None:
+                headers['If-Range'] = email.utils.formatdate(if_range, usegmt=True)
+        return self._access.stream('dl/{0}'.format(path_b64), headers)
+
+
+    def upload(self, local_path, remote_dir, filename=None, chunk_size=1024*1024, resume=False, progress=None, retries=3):
+        '''
+        Upload local_path to the remote_dir folder over the ws/upload websocket.
+        See upload_async(), use it directly from a running event loop.
+        '''
+        return asyncio.run(self.upload_async(local_path, remote_dir, filename, chunk_size, resume, progress, retries))
+
+
+    async def upload_async(self, local_path, remote_dir, filename=None, chunk_size=1024*1024, resume=False, progress=None, retries=3):
+        '''
+        Upload local_path to the remote_dir folder over the ws/upload websocket.
+        The file is memory mapped and sent in chunk_size frames.
+        resume: continue a partial remote file of the same name instead of
+        overwriting it. After a dropped connection the upload is resumed
+        from the size of the remote file, up to retries times, as long as
+        the remote file only holds bytes sent by this upload: a file of
+        the same name which was there before is overwritten.
+        progress(bytes_sent) is called after each chunk.
+        Returns the size of the file.
+        '''
+        aiohttp = import_aiohttp()
+        filename = filename or os.path.basename(local_path)
+        remote_path = posixpath.join(remote_dir, filename)
+        size = os.path.getsize(local_path)
+        attempt = 0
+        # started: the box accepted an upload_start of this call, which
+        # sent the first sent bytes of the file
+        state = {'started': resume, 'sent': size if resume else 0}
+
+        with open(local_path, 'rb') as f, self._map_file(f, size) as data:
+            async with ws_session(self._access) as session:
+                while True:
+                    offset = 0
+                    if state['started']:
+                        offset = await self._remote_size(remote_path)
+                        offset = 0 if offset > size else min(offset, state['sent'])
+
+                    header = self._access.header
+                    try:
+                        await self._ws_upload(session, header, data, size, remote_dir, filename, offset, chunk_size, progress, state)
+                        return size
+
+                    except aiohttp.WSServerHandshakeError as e:
+                        if e.status not in (401, 403) or attempt >= retries:
+                            raise
+                        await renew_header(self._access, header)
+
+                    except (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError) as e:
+                        if attempt >= retries:
+                            raise
+                        logger.warning('upload of {0} interrupted, resuming: {1}'.format(local_path, e))
+                        await asyncio.sleep(min(2 ** attempt, 30))
+
+                    attempt += 1
+
+
+    async def _ws_upload(self, session, header, data, size, remote_dir, filename, offset, chunk_size, progress, state):
+        '''
+        Send data from offset in one ws/upload session, state records
+        the accepted upload_start and the bytes sent
+        '''
+        async with session.ws_connect(ws_url(self._access, 'ws/upload'), headers=header, ssl=ssl_context(self._access)) as ws:
+            await ws.send_json({
+                'action': 'upload_start',
+                'request_id': 1,
+                'size': size,
+                'dirname': self._encode_path(remote_dir),
+                'filename': filename,
+                'force': 'resume' if offset else 'overwrite',
+                })
+            await self._ws_reply(ws, 'upload_start')
+            state['started'] = True
+
+            for pos in range(offset, size, chunk_size):
+                await ws.send_bytes(data[pos:pos + chunk_size])
+                state['sent'] = max(state['sent'], min(pos + chunk_size, size))
+                if progress is not None:
+                    progress(min(pos + chunk_size, size))
+
+            await ws.send_json({'action': 'upload_finalize', 'request_id': 1})
+            await self._ws_reply(ws, 'upload_finalize')
+
+
+    async def _ws_reply(self, ws, action):
+        '''
+        Wait for the reply to action, raise HttpRequestError if it failed
+        '''
+        aiohttp = import_aiohttp()
+        async for msg in ws:
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                break
+            reply = msg.json()
+            if not reply.get('success', True):
+                raise HttpRequestError(reply.get('error_code'))
+            if reply.get('action') == action:
+                return reply
+        raise ConnectionError('ws/upload closed before {0} reply'.format(action))
+
+
+    async def _remote_size(self, path):
+        '''
+        Returns the size of the remote file, 0 if it does not exist
+        '''
+        try:
+            info = self.get_file_info(path)
+            if inspect.isawaitable(info):
+                info = await info
+        except HttpRequestError:
+            return 0
+        return info.get('size', 0)
+
+
+    def _map_file(self, f, size):
+        '''
+        Returns a read only memory map of f, mmap cannot map empty files
+        '''
+        if size == 0:
+            return contextlib.nullcontext(b'')
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class FsTask:
+    '''
+    Handle on a file system task (copy, move, remove, archive...)
+    info holds the last known task object, state is one of
+    queued, running, paused, done, failed
+    '''
+    finished_states = ('done', 'failed')
+
+    def __init__(self, fs, info):
+        self._fs = fs
+        self.id = info['id']
+        self.info = info
+
+
+    @property
+    def state(self):
+        return self.info.get('state')
+
+
+    def is_finished(self):
+        return self.state in self.finished_states
+
+
+    def refresh(self):
+        '''
+        Fetch the task state
+        '''
+        self.info = self._fs.get_task(self.id)
+        return self.info
+
+
+    def wait(self, timeout=None, interval=0.2, max_interval=5):
+        '''
+        Wait for the task to be done or failed. The poll interval
+        doubles up to max_interval while the task is still running.
+        Returns the task info, check its state for failures.
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.is_finished():
+            if deadline is not None and time.monotonic() + interval > deadline:
+                raise TimeoutError('fs task {0} still {1}'.format(self.id, self.state))
+            time.sleep(interval)
+            interval = min(interval * 2, max_interval)
+            self.refresh()
+        return self.info
+
+
+    def delete(self):
+        '''
+        Delete the task from the tasks list
+        '''
+        return self._fs.delete_task(self.id)
 
@@ -0,0 +1,201 @@
+import contextvars
+import logging
+import posixpath
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from freepybox.exceptions import *
+from freepybox.access import require_blocking
+
+logger = logging.getLogger(__name__)
+
+class FsIndex:
+    '''
+    Local SQLite index of the freebox file tree (path, size, mtime, type).
+    refresh() only lists again the folders whose modification time changed,
+    find() answers name/extension/size queries without querying the box.
+        index = FsIndex(fbx.fs, 'nas.db', root='/Disque dur')
+        index.refresh()
+        index.find(ext='mkv', min_size=1 << 30)
+    Only available with the blocking Freepybox.
+    '''
+    def __init__(self, fs, db_path, root='/'):
+        require_blocking(fs._access, 'FsIndex')
+        self._fs = fs
+        self.root = root
+        self._db = sqlite3.connect(db_path)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS entries (
+                path TEXT PRIMARY KEY,
+                parent TEXT NOT NULL,
+                name TEXT NOT NULL,
+                ext TEXT NOT NULL,
+                type TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL,
+                listed_mtime INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS entries_parent ON entries (parent);
+            CREATE INDEX IF NOT EXISTS entries_name ON entries (name);
+            CREATE INDEX IF NOT EXISTS entries_ext ON entries (ext);
+            CREATE INDEX IF NOT EXISTS entries_size ON entries (size);
+            ''')
+
+
+    def close(self):
+        '''
+        Close the index database
+        '''
+        self._db.close()
+
+
+    def refresh(self, max_workers=8):
+        '''
+        Bring the index up to date, requests run on max_workers threads.
+        Folders whose modification time did not change are not listed,
+        only their sub folders are checked with a fs/info request.
+        Returns {'listed': folders listed, 'added', 'removed', 'updated': entries}
+        '''
+        stats = {'listed': 0, 'added': 0, 'removed': 0, 'updated': 0}
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        pending = {}
+
+        def submit(fn, path):
+            # In a copy of the caller context, for priority()
+            return executor.submit(contextvars.copy_context().run, fn, path)
+
+        def check_dir(path, mtime):
+            row = self._db.execute('SELECT listed_mtime FROM entries WHERE path = ?', (path,)).fetchone()
+            if row is not None and row['listed_mtime'] == mtime:
+                for child in self._db.execute("SELECT path FROM entries WHERE parent = ? AND type = 'dir'", (path,)):
+                    pending[submit(self._fs.get_file_info, child['path'])] = ('info', child['path'], None)
+            else:
+                pending[submit(self._fs.list_file, path)] = ('ls', path, mtime)
+
+        try:
+            root_info = self._fs.get_file_info(self.root)
+            self._upsert_root(root_info)
+            check_dir(self.root, root_info.get('modification', 0))
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, path, mtime = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except HttpRequestError as e:
+                        logger.warning('{0} {1} failed: {2}'.format(kind, path, e))
+                        continue
+
+                    if kind == 'info':
+                        mtime = result.get('modification', 0)
+                        self._db.execute('UPDATE entries SET mtime = ? WHERE path = ?', (mtime, path))
+                        check_dir(path, mtime)
+                    else:
+                        stats['listed'] += 1
+                        for child, child_mtime in self._update_dir(path, mtime, result or [], stats):
+                            check_dir(child, child_mtime)
+
+            self._db.commit()
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+        return stats
+
+
+    def find(self, name=None, ext=None, type=None, min_size=None, max_size=None, under=None, limit=None):
+        '''
+        Returns the indexed entries matching all the given criteria:
+            name: glob pattern on the file name, e.g. '*.mkv' or 'IMG_*'
+            ext: file extension without dot, case insensitive
+            type: 'file' or 'dir'
+            min_size, max_size: size bounds in bytes
+            under: folder path the entries must be in
+        '''
+        clauses, args = [], []
+        if name is not None:
+            clauses.append('name GLOB ?')
+            args.append(name)
+        if ext is not None:
+            clauses.append('ext = ?')
+            args.append(ext.lower().lstrip('.'))
+        if type is not None:
+            clauses.append('type = ?')
+            args.append(type)
+        if min_size is not None:
+            clauses.append('size >= ?')
+            args.append(min_size)
+        if max_size is not None:
+            clauses.append('size <= ?')
+            args.append(max_size)
+        if under is not None:
+            prefix = under.rstrip('/') + '/'
+            clauses.append('substr(path, 1, ?) = ?')
+            args.extend((len(prefix), prefix))
+
+        query = 'SELECT path, name, ext, type, size, mtime FROM entries'
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        query += ' ORDER BY path'
+        if limit is not None:
+            query += ' LIMIT ?'
+            args.append(limit)
+        return [dict(row) for row in self._db.execute(query, args)]
+
+
+    def folder_size(self, path):
+        '''
+        Returns the total size of the indexed files under path
+        '''
+        prefix = path.rstrip('/') + '/'
+        row = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries WHERE type = 'file' AND substr(path, 1, ?) = ?",
+                               (len(prefix), prefix)).fetchone()
+        return row[0]
+
+
+    def _upsert_root(self, info):
+        self._db.execute('''INSERT INTO entries (path, parent, name, ext, type, size, mtime) VALUES (?, '', ?, '', 'dir', 0, ?)
+                            ON CONFLICT(path) DO UPDATE SET mtime = excluded.mtime''',
+                         (self.root, posixpath.basename(self.root.rstrip('/')), info.get('modification', 0)))
+
+
+    def _update_dir(self, path, mtime, entries, stats):
+        '''
+        Replace the children of path with a fresh listing.
+        Returns [(sub folder path, mtime)] to check next.
+        '''
+        known = {row['path']: row for row in self._db.execute('SELECT path, size, mtime FROM entries WHERE parent = ?', (path,))}
+        rows = []
+        sub_dirs = []
+        for entry in entries:
+            name = entry['name']
+            if name in ('.', '..'):
+                continue
+            child = posixpath.join(path, name)
+            is_dir = entry.get('type') == 'dir'
+            ext = '' if is_dir else posixpath.splitext(name)[1].lower().lstrip('.')
+            size = entry.get('size', 0)
+            child_mtime = entry.get('modification', 0)
+            rows.append((child, path, name, ext, 'dir' if is_dir else 'file', size, child_mtime))
+            if is_dir:
+                sub_dirs.append((child, child_mtime))
+
+            old = known.pop(child, None)
+            if old is None:
+                stats['added'] += 1
+            elif old['size'] != size or old['mtime'] != child_mtime:
+                stats['updated'] += 1
+
+        # Entries which disappeared, with their whole sub tree
+        for removed in known:
+            prefix = removed + '/'
+            cursor = self._db.execute('DELETE FROM entries WHERE path = ? OR substr(path, 1, ?) = ?', (removed, len(prefix), prefix))
+            stats['removed'] += cursor.rowcount
+
+        self._db.executemany('''INSERT INTO entries (path, parent, name, ext, type, size, mtime) VALUES (?, ?, ?, ?, ?, ?, ?)
+                                ON CONFLICT(path) DO UPDATE SET ext = excluded.ext, type = excluded.type,
+                                size = excluded.size, mtime = excluded.mtime''', rows)
+        self._db.execute('UPDATE entries SET listed_mtime = ? WHERE path = ?', (mtime, path))
+        return sub_dirs
@@ -54,3 +54,9 @@ class Fsnav:
         for i in self._fs.list_file(self._path):
             print(i['name'])
 
+
+    def walk(self, **kwargs):
+        '''
+        Walk the tree under the working directory, see Fs.walk()
+        '''
+        return self._fs.walk(self._path, **kwargs)
@@ -1,3 +1,7 @@
+import time
+from freepybox.access import require_blocking
+from freepybox.batch import run_batch
+
 class Lan:
 
     def __init__(self, access):
@@ -15,7 +19,7 @@ class Lan:
         '''
         Update Lan config with conf dictionary
         '''
-        self._access.put('lan/config/', conf)
+        return self._access.put('lan/config/', conf)
 
 
     def get_interfaces(self):
@@ -43,7 +47,7 @@ class Lan:
         '''
         Update specific host informations on a given interface¶
         '''
-        self._access.put('lan/browser/{0}/{1}'.format(interface, host_id), conf)
+        return self._access.put('lan/browser/{0}/{1}'.format(interface, host_id), conf)
 
     def wol(self, data, interface='pub'):
         '''
@@ -51,3 +55,79 @@ class Lan:
         '''
         return self._access.post('lan/wol/{0}/'.format(interface), data)
 
+
+    def watch_hosts(self, interval=10):
+        '''
+        Poll the hosts of all interfaces every interval seconds and
+        yield only the changes, see HostTable.poll()
+        '''
+        require_blocking(self._access, 'Lan.watch_hosts()')
+        table = HostTable(self)
+        while True:
+            changes = table.poll()
+            if any(changes.values()):
+                yield changes
+            time.sleep(interval)
+
+
+class HostTable:
+    '''
+    MAC-keyed index of the Lan hosts of every browsable interface.
+    Each poll() reports only the hosts added, removed or changed
+    (reachability, IP addresses, names) since the previous poll.
+    Only available with the blocking Freepybox.
+    '''
+    def __init__(self, lan):
+        require_blocking(lan._access, 'HostTable')
+        self._lan = lan
+        self.hosts = {}
+        self._signatures = {}
+
+
+    def poll(self):
+        '''
+        Refresh the table.
+        Returns {'added': [hosts], 'removed': [hosts], 'changed': [hosts]}
+        '''
+        interfaces = [i['name'] for i in self._lan.get_interfaces() or []]
+        results = run_batch([(self._lan.get_hosts_list, i) for i in interfaces])
+
+        hosts = {}
+        for interface, hosts_list in zip(interfaces, results):
+            if isinstance(hosts_list, Exception):
+                raise hosts_list
+            for host in hosts_list or []:
+                host['interface'] = interface
+                hosts[self._host_key(host)] = host
+
+        signatures = {k: self._signature(h) for k, h in hosts.items()}
+        changes = {
+            'added': [hosts[k] for k in signatures.keys() - self._signatures.keys()],
+            'removed': [self.hosts[k] for k in self._signatures.keys() - signatures.keys()],
+            'changed': [hosts[k] for k in signatures.keys() & self._signatures.keys()
+                        if signatures[k] != self._signatures[k]],
+            }
+
+        self.hosts = hosts
+        self._signatures = signatures
+        return changes
+
+
+    def _host_key(self, host):
+        '''
+        Returns the MAC address of the host, its id if it has none
+        '''
+        l2ident = host.get('l2ident') or {}
+        if l2ident.get('type') == 'mac_address':
+            return l2ident['id'].lower()
+        return host['id']
+
+
+    def _signature(self, host):
+        '''
+        Returns the tracked fields of a host as a hashable tuple
+        '''
+        addrs = tuple(sorted((l3.get('addr'), bool(l3.get('reachable')))
+                             for l3 in host.get('l3connectivities') or []))
+        names = tuple(sorted(n.get('name', '') for n in host.get('names') or []))
+        return (bool(host.get('reachable')), addrs, host.get('primary_name'), names)
@@ -15,7 +15,7 @@ class Phone:
         '''
         Update phone configuration:
         '''
-        self._access.put('phone/', conf)
+        return self._access.put('phone/', conf)
 
 
     def get_dect_vendors(self):
@@ -0,0 +1,83 @@
+import time
+from operator import itemgetter
+from freepybox.access import require_blocking
+
+
+def _import_numpy():
+    '''
+    Returns the numpy module, used to decode rrd data
+    '''
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('Rrd.fetch requires numpy: pip install freepybox[rrd]')
+    return numpy
+
+
+class Rrd:
+    '''
+    Freebox RRD history databases:
+        net   : bw_up, bw_down, rate_up, rate_down, vpn_rate_up, vpn_rate_down
+        temp  : cpum, cpub, sw, hdd, fan_speed
+        dsl   : rate_up, rate_down, snr_up, snr_down
+        switch: rx_1, tx_1, ... rx_4, tx_4
+    '''
+    def __init__(self, access):
+        self._access = access
+
+
+    def get_rrd(self, db, date_start=None, date_end=None, fields=None, precision=None):
+        '''
+        Query one page of a rrd database.
+        Returns {'date_start', 'date_end', 'data': [{'time', field: value}]}
+        '''
+        payload = {'db': db}
+        if date_start is not None:
+            payload['date_start'] = int(date_start)
+        if date_end is not None:
+            payload['date_end'] = int(date_end)
+        if fields is not None:
+            payload['fields'] = list(fields)
+        if precision is not None:
+            payload['precision'] = precision
+        return self._access.post('rrd/', payload)
+
+
+    def fetch(self, db, date_start, date_end=None, fields=None, precision=None):
+        '''
+        Query a rrd database over a time range, following as many pages
+        as the freebox needs to cover it.
+        Returns (timestamps, {field: values}) as numpy arrays, missing
+        values are NaN
+        Only available with the blocking Freepybox.
+        '''
+        require_blocking(self._access, 'Rrd.fetch()')
+        np = _import_numpy()
+        date_end = int(time.time()) if date_end is None else int(date_end)
+        query_fields = None if fields is None else ['time'] + [f for f in fields if f != 'time']
+
+        rows = []
+        start = int(date_start)
+        while start <= date_end:
+            page = self.get_rrd(db, start, date_end, query_fields, precision) or {}
+            data = page.get('data') or []
+            if not data:
+                break
+            rows.extend(data)
+
+            # The freebox returns a bounded number of points, continue after the last one
+            last = data[-1]['time']
+            if last < start:
+                break
+            start = last + 1
+
+        if fields is None:
+            fields = [f for f in rows[0] if f != 'time'] if rows else []
+
+        count = len(rows)
+        timestamps = np.fromiter(map(itemgetter('time'), rows), dtype=np.int64, count=count)
+        nan = float('nan')
+        columns = {f: np.fromiter((row.get(f, nan) for row in rows), dtype=np.float64, count=count)
+                   for f in fields}
+
+        return timestamps, columns
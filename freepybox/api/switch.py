@@ -1,7 +1,15 @@
+import time
+from array import array
+from freepybox.access import require_blocking
+from freepybox.batch import run_batch
+
 class Switch:
 
-    def __init__(self, access):
+    def __init__(self, access, stats_history=60):
         self._access = access
+        self.stats_history = stats_history
+        self._port_ids = None
+        self._stats_rings = {}
 
 
     def get_status(self):
@@ -22,7 +30,7 @@ class Switch:
         '''
         Update port_id Port configuration with conf dictionary
         '''
-        self._access.put('switch/port/{0}'.format(port_id), conf)
+        return self._access.put('switch/port/{0}'.format(port_id), conf)
 
 
     def get_port_stats(self, port_id):
@@ -30,3 +38,110 @@ class Switch:
         Get port_id Port stats
         '''
         return self._access.get('switch/port/{0}/{1}'.format(port_id, 'stats'))
+
+
+    def collect_stats(self, max_workers=8):
+        '''
+        Fetch the stats of all ports concurrently and keep them in a ring
+        buffer of stats_history samples per port.
+        Returns {port_id: rates}, see PortStatsRing.rates()
+        Only available with the blocking Freepybox.
+        '''
+        require_blocking(self._access, 'Switch.collect_stats()')
+        if self._port_ids is None:
+            self._port_ids = [p['id'] for p in self.get_status()]
+
+        results = run_batch([(self.get_port_stats, p) for p in self._port_ids], max_workers)
+        now = time.monotonic()
+
+        rates = {}
+        for port_id, stats in zip(self._port_ids, results):
+            if isinstance(stats, Exception):
+                raise stats
+            ring = self._stats_rings.get(port_id)
+            if ring is None:
+                ring = self._stats_rings[port_id] = PortStatsRing(self.stats_history)
+            ring.append(now, stats)
+            rates[port_id] = ring.rates()
+
+        return rates
+
+
+    def get_stats_history(self, port_id):
+        '''
+        Returns the PortStatsRing of port_id filled by collect_stats()
+        '''
+        return self._stats_rings.get(port_id)
+
+
+class PortStatsRing:
+    '''
+    Fixed-size ring buffer of port counters samples stored in a flat
+    array of doubles: one row of (time, *counters) per sample
+    '''
+    # Counters turned into per second rates
+    rate_counters = ('rx_good_bytes', 'tx_bytes', 'rx_good_packets', 'tx_packets')
+    rate_names = ('rx_bytes_rate', 'tx_bytes_rate', 'rx_packets_rate', 'tx_packets_rate')
+
+    # Error counters turned into deltas between samples
+    error_counters = ('rx_err_packets', 'rx_fcs_packets', 'tx_collisions', 'tx_fcs')
+
+    counters = rate_counters + error_counters
+
+    def __init__(self, capacity=60):
+        self.capacity = capacity
+        self._width = len(self.counters) + 1
+        self._data = array('d', bytes(8 * capacity * self._width))
+        self._next = 0
+        self.count = 0
+
+
+    def append(self, timestamp, stats):
+        '''
+        Append the counters of a get_port_stats() result taken at timestamp
+        '''
+        offset = self._next * self._width
+        self._data[offset] = timestamp
+        for i, counter in enumerate(self.counters, 1):
+            self._data[offset + i] = stats.get(counter, 0)
+        self._next = (self._next + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+
+    def sample(self, age=0):
+        '''
+        Returns (timestamp, {counter: value}) of a sample, age 0 being the latest
+        '''
+        if age >= self.count:
+            raise IndexError('no such sample')
+        offset = ((self._next - 1 - age) % self.capacity) * self._width
+        row = self._data[offset:offset + self._width]
+        return row[0], dict(zip(self.counters, row[1:]))
+
+
+    def rates(self):
+        '''
+        Returns the rates and error deltas between the two latest samples:
+            {'rx_bytes_rate', 'tx_bytes_rate', 'rx_packets_rate', 'tx_packets_rate',
+             'rx_err_packets', 'rx_fcs_packets', 'tx_collisions', 'tx_fcs'}
+        or None while there is a single sample
+        '''
+        if self.count < 2:
+            return None
+
+        t1, last = self.sample(0)
+        t0, prev = self.sample(1)
+        elapsed = t1 - t0
+
+        result = {}
+        for counter in self.counters:
+            delta = last[counter] - prev[counter]
+            # Counters restart from zero when the freebox reboots
+            if delta < 0:
+                delta = last[counter]
+            result[counter] = delta
+
+        for counter, name in zip(self.rate_counters, self.rate_names):
+            result[name] = result.pop(counter) / elapsed if elapsed > 0 else 0.0
+
+        return result
@@ -15,7 +15,7 @@ class System:
         '''
         Reboot freebox
         '''
-        self._access.post('system/reboot')
+        return self._access.post('system/reboot')
 
 
 
@@ -15,7 +15,7 @@ class Wifi:
         '''
         Update wifi global configuration:
         '''
-        self._access.put('wifi/config/', conf)
+        return self._access.put('wifi/config/', conf)
 
 
     def get_ap_list(self):
@@ -36,7 +36,7 @@ class Wifi:
         '''
         Update wifi access point with the specific id
         '''
-        self._access.get('wifi/ap/{0}'.format(ap_id), conf)
+        return self._access.put('wifi/ap/{0}'.format(ap_id), conf)
         
 
     def get_ap_allowed_channel(self, ap_id):
@@ -75,4 +75,4 @@ class Wifi:
         '''
         Update wifi BSS with the specific id
         '''
-        self._access.get('wifi/bss/{0}'.format(ap_id), conf)
+        return self._access.put('wifi/bss/{0}'.format(ap_id), conf)
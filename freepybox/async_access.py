@@ -0,0 +1,167 @@
+import asyncio
+from urllib.parse import urljoin
+from freepybox.exceptions import *
+from freepybox.retry import is_box_failure
+from freepybox.codec import JsonCodec
+from freepybox.instrument import before_request, after_request
+from freepybox.access import session_error_codes, decode_response
+
+class AsyncAccess:
+    def __init__(self, session, base_url, session_token, http_timeout, renew_session=None, cache=None, retry=None, breaker=None, limiter=None, codec=None, hooks=None):
+        self.session = session
+        self.header = {'X-Fbx-App-Auth': session_token}
+        self.base_url = base_url
+        self.timeout = http_timeout
+        self.renew_session = renew_session
+        self.cache = cache
+        self.retry = retry
+        self.breaker = breaker
+        self.limiter = limiter
+        self.codec = codec or JsonCodec()
+        # Objects with before_request(info) and/or after_request(info) methods
+        self.hooks = list(hooks or [])
+        self._renew_lock = None
+
+
+    async def get(self, end_url):
+        '''
+        Send get request and return results
+        '''
+        return await self._request('GET', end_url)
+
+
+    async def post(self, end_url, payload=None):
+        '''
+        Send post request and return results
+        '''
+        return await self._request('POST', end_url, payload)
+
+
+    async def put(self, end_url, payload=None):
+        '''
+        Send put request and return results
+        '''
+        return await self._request('PUT', end_url, payload)
+
+
+    async def delete(self, end_url):
+        '''
+        Send delete request and return results
+        '''
+        return await self._request('DELETE', end_url)
+
+
+    async def _request(self, method, end_url, payload=None):
+        '''
+        Send the request and return results.
+        When the session has expired, the session token is renewed
+        with the renew_session coroutine and the request is sent again once.
+        GET results are served from the cache when there is one, other
+        methods invalidate the cached entries under end_url.
+        '''
+        if method == 'GET' and self.cache is not None:
+            hit, result = self.cache.lookup(end_url)
+            if hit:
+                return result
+
+        url = urljoin(self.base_url, end_url)
+        data = self.codec.dumps(payload) if payload is not None else None
+        header = self.header
+        resp = await self._send_retry(method, end_url, url, data, header)
+
+        if resp.get('error_code') in session_error_codes and self.renew_session is not None:
+            header = await self._renew_header(header)
+            resp = await self._send_retry(method, end_url, url, data, header)
+
+        if method != 'GET' and self.cache is not None:
+            self.cache.invalidate(end_url)
+
+        if resp['success'] != True:
+            raise HttpRequestError(resp['error_code'])
+
+        if method == 'GET' and self.cache is not None:
+            self.cache.store(end_url, resp.get('result'))
+
+        if 'result' in resp:
+            return resp['result']
+
+
+    async def _renew_header(self, failed_header):
+        '''
+        Return the header of a renewed session. Tasks failing on the same
+        expired session wait for a single login and share its new token.
+        '''
+        if self._renew_lock is None:
+            self._renew_lock = asyncio.Lock()
+
+        async with self._renew_lock:
+            if self.header is failed_header:
+                self.header = {'X-Fbx-App-Auth': await self.renew_session()}
+            return self.header
+
+
+    async def _send_retry(self, method, end_url, url, data, header):
+        '''
+        Send the request, idempotent requests failing on a network or
+        server error are sent again with backoff
+        '''
+        attempt = 0
+        while True:
+            try:
+                return await self._send_once(method, end_url, url, data, header)
+            except Exception as e:
+                if self.retry is None or not self.retry.should_retry(method, attempt, e):
+                    raise
+            await asyncio.sleep(self.retry.delay(attempt))
+            attempt += 1
+
+
+    async def _send_once(self, method, end_url, url, data, header):
+        '''
+        Send the request once through the circuit breaker, the rate limiter
+        and the hooks
+        '''
+        trial = self.breaker is not None and self.breaker.before_request()
+        try:
+            if self.limiter is not None:
+                await self.limiter.acquire_async(end_url)
+            info = before_request(self.hooks, method, end_url, data) if self.hooks else None
+            try:
+                resp = await self._send(method, url, data, header, info)
+            except Exception as e:
+                if info is not None:
+                    after_request(self.hooks, info, type(e).__name__)
+                if self.breaker is not None and is_box_failure(e):
+                    self.breaker.record_failure()
+                raise
+
+            if info is not None:
+                after_request(self.hooks, info, None if resp.get('success') else resp.get('error_code'))
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return resp
+        finally:
+            # A trial ending without an answer (cancelled, failing hook...)
+            # must not leave the breaker open forever
+            if trial:
+                self.breaker.end_trial()
+
+
+    async def _send(self, method, url, data, header, info=None):
+        '''
+        Send the request on the aiohttp session and return the json body
+        decoded from bytes by the codec, info is completed for the hooks.
+        A 5xx status raises ServerError with the freebox error_code and
+        msg when the body has them.
+        '''
+        import aiohttp
+        try:
+            async with self.session.request(method, url, headers=header, data=data) as r:
+                if info is not None:
+                    info.status = r.status
+                body = await r.read()
+                if info is not None:
+                    info.response_size = len(body)
+                return decode_response(self.codec, r.status, body)
+        except aiohttp.ClientError as e:
+            raise ConnectionError(str(e)) from e
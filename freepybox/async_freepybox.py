@@ -0,0 +1,164 @@
+import asyncio
+import json
+import logging
+import time
+from urllib.parse import urljoin
+from freepybox.exceptions import *
+from freepybox.freepybox import Freepybox, root_ca_file
+from freepybox.async_access import AsyncAccess
+from freepybox.batch import run_batch_async
+
+
+logger = logging.getLogger(__name__)
+
+class AsyncFreepybox(Freepybox):
+    '''
+    Asyncio flavour of Freepybox backed by aiohttp.
+    Modules are the same as Freepybox but every call must be awaited:
+        await fbx.open(host, port)
+        config = await fbx.system.get_config()
+    '''
+    def __init__(self, *args, **kwargs):
+        Freepybox.__init__(self, *args, **kwargs)
+        if getattr(self.transport, 'blocking_only', False):
+            raise TypeError('{0} only supports the blocking Freepybox'.format(type(self.transport).__name__))
+
+
+    async def open(self, host, port):
+        '''
+        Open a session to the freebox, get a valid access module
+        and instantiate freebox modules
+        '''
+        try:
+            import aiohttp
+        except ImportError:
+            raise ImportError('AsyncFreepybox requires aiohttp: pip install freepybox[async]')
+
+        if not self._is_app_desc_valid(self.app_desc): raise InvalidTokenError('invalid application descriptor')
+
+        self.open_timings = {}
+        self._timing_open = True
+        start = time.perf_counter()
+        try:
+            with self._phase('transport'):
+                ssl_context = self.transport.create_ssl_context(root_ca_file)
+                self.session = aiohttp.ClientSession(
+                    connector=self.transport.create_connector(ssl_context),
+                    timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+            try:
+                self._access = await self._get_freebox_access(host, port, self.api_version, self.token_file, self.app_desc, self.timeout)
+            except:
+                await self.session.close()
+                raise
+        finally:
+            self._timing_open = False
+
+        # Instantiate freebox modules
+        self._init_modules()
+        self._end_open(start)
+
+
+    async def close(self, logout=True):
+        '''
+        Close the freebox session.
+        With logout=False the session is kept open on the freebox
+        so that the token stored in token_file can be reused by the next open()
+        '''
+        if self._access is None: raise NotOpenError('Freebox is Not opened')
+
+        try:
+            if logout:
+                await self._access.post('login/logout')
+                self._writefile_session_token(None, None, self.token_file)
+        finally:
+            await self.session.close()
+
+
+    async def batch(self, calls, max_workers=8):
+        '''
+        Await module calls concurrently, at most max_workers in flight.
+        Returns results in the same order, a failing call gives its exception.
+        '''
+        return await run_batch_async(calls, max_workers)
+
+
+    async def _get_freebox_access(self, host, port, api_version, token_file, app_desc, timeout=10):
+        '''
+        Returns an async access object used for HTTP requests.
+        '''
+
+        base_url = self._get_base_url(host, port, api_version)
+
+        # If no valid token is stored then request a token to freebox api - Only for LAN connection
+        app_token = self._read_app_token(token_file, app_desc)
+        if app_token is None:
+            with self._phase('authorize'):
+                app_token, track_id = await self._get_app_token(base_url, app_desc, timeout)
+
+                # The user must accept the app request on the freebox
+                prompted = False
+                while self._authorization_pending(await self._get_authorization_status(base_url, track_id, timeout), prompted):
+                    prompted = True
+                    await asyncio.sleep(1)
+
+                self._store_app_token(app_token, track_id, app_desc, token_file)
+
+        # Reuse the session token stored in file, or get a token for a new session
+        session_token = self._read_session(token_file)
+        if session_token is None:
+            session_token = self._store_session(await self._get_session_token(base_url, app_token, app_desc['app_id'], timeout), token_file)
+
+        async def renew_session():
+            logger.info('Session expired, opening a new session')
+            return self._store_session(await self._get_session_token(base_url, app_token, app_desc['app_id'], timeout), token_file)
+
+        return self._create_access(AsyncAccess, base_url, session_token, timeout, renew_session)
+
+
+    async def _get_authorization_status(self, base_url, track_id, timeout):
+        '''
+        Get authorization status of the application token
+        '''
+        url = urljoin(base_url, 'login/authorize/{0}'.format(track_id))
+        resp = await self._get_json('GET', url)
+        return resp['result']['status']
+
+
+    async def _get_app_token(self, base_url, app_desc, timeout=10):
+        """
+        Get the application token from the freebox
+        Returns (app_token, track_id)
+        """
+        url = urljoin(base_url, 'login/authorize/')
+        return self._app_token_result(await self._get_json('POST', url, json.dumps(app_desc)))
+
+
+    async def _get_session_token(self, base_url, app_token, app_id, timeout=10):
+        """
+        Get session token from freebox.
+        Returns (session_token, session_permissions)
+        """
+        # Get challenge from API
+        with self._phase('challenge'):
+            challenge = await self._get_challenge(base_url, timeout)
+
+        url = urljoin(base_url, 'login/session/')
+        with self._phase('session'):
+            return self._session_result(await self._get_json('POST', url, self._session_request(app_token, app_id, challenge)))
+
+
+    async def _get_challenge(self, base_url, timeout=10):
+        '''
+        Return challenge from freebox API
+        '''
+        url = urljoin(base_url, 'login')
+        return self._challenge_result(await self._get_json('GET', url))
+
+
+    async def _get_json(self, method, url, data=None):
+        '''
+        Send an unauthenticated request and return the decoded json body
+        '''
+        async with self.session.request(method, url, data=data) as r:
+            return await r.json(content_type=None)
@@ -0,0 +1,56 @@
+def _split_call(call):
+    '''
+    Return (function, args) from a batch call: either a callable
+    or a tuple (callable, arg1, arg2, ...)
+    '''
+    if isinstance(call, tuple):
+        return call[0], call[1:]
+    return call, ()
+
+
+def _run_call(call):
+    '''
+    Run a single batch call, return its result or the raised exception
+    '''
+    fn, args = _split_call(call)
+    try:
+        return fn(*args)
+    except Exception as e:
+        return e
+
+
+def run_batch(calls, max_workers=8):
+    '''
+    Run calls in parallel over a bounded thread pool, each in a copy of
+    the caller context so that priority() applies to them.
+    Returns the results in the calls order, a failing call
+    gives the raised exception instead of its result.
+    '''
+    import contextvars
+    from concurrent.futures import ThreadPoolExecutor
+
+    calls = list(calls)
+    if not calls:
+        return []
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(calls))) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, _run_call, call) for call in calls]
+        return [future.result() for future in futures]
+
+
+async def run_batch_async(calls, max_workers=8):
+    '''
+    Await calls concurrently, at most max_workers requests in flight.
+    Returns the results in the calls order, a failing call
+    gives the raised exception instead of its result.
+    '''
+    import asyncio
+
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def run_call(call):
+        fn, args = _split_call(call)
+        async with semaphore:
+            return await fn(*args)
+
+    return await asyncio.gather(*(run_call(c) for c in calls), return_exceptions=True)
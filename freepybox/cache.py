@@ -0,0 +1,81 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    '''
+    LRU cache of GET results with a TTL per endpoint prefix.
+    ttl maps endpoint prefixes to a lifetime in seconds, e.g.
+        {'system/': 5, 'lan/config/': 30, 'dhcp/config/': 30}
+    Only endpoints under one of these prefixes are cached, the longest
+    matching prefix gives the TTL.
+    '''
+    def __init__(self, ttl, size=128):
+        self.ttl = dict(ttl)
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def lookup(self, end_url):
+        '''
+        Returns (True, result) for a fresh cached entry, (False, None) otherwise
+        '''
+        with self._lock:
+            entry = self._entries.get(end_url)
+            if entry is None:
+                return (False, None)
+
+            expires, result = entry
+            if expires < time.monotonic():
+                del self._entries[end_url]
+                return (False, None)
+
+            self._entries.move_to_end(end_url)
+
+        # Callers are free to modify the returned result
+        return (True, copy.deepcopy(result))
+
+
+    def store(self, end_url, result):
+        '''
+        Cache the result of a GET on end_url if one of the prefixes matches
+        '''
+        prefix = self._match(end_url)
+        if prefix is None:
+            return
+
+        entry = (time.monotonic() + self.ttl[prefix], copy.deepcopy(result))
+        with self._lock:
+            self._entries[end_url] = entry
+            self._entries.move_to_end(end_url)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+
+    def invalidate(self, end_url):
+        '''
+        Drop the cached entries under end_url and under its matching prefix
+        '''
+        prefix = self._match(end_url) or end_url
+        with self._lock:
+            for k in [k for k in self._entries if k.startswith(prefix) or k.startswith(end_url)]:
+                del self._entries[k]
+
+
+    def clear(self):
+        '''
+        Drop all cached entries
+        '''
+        with self._lock:
+            self._entries.clear()
+
+
+    def _match(self, end_url):
+        '''
+        Returns the longest prefix matching end_url, None if there is none
+        '''
+        prefixes = [p for p in self.ttl if end_url.startswith(p)]
+        return max(prefixes, key=len) if prefixes else None
@@ -0,0 +1,89 @@
+import json
+
+
+class JsonCodec:
+    '''
+    Standard library json codec.
+    A codec encodes request payloads to bytes with dumps(obj) and decodes
+    response bodies from bytes with loads(data), raising ValueError on
+    invalid json.
+    '''
+    name = 'json'
+
+    def dumps(self, obj):
+        return json.dumps(obj).encode()
+
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    '''
+    orjson codec (pip install freepybox[fast-json]), decodes straight from bytes
+    '''
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+        self._options = orjson.OPT_NON_STR_KEYS
+
+
+    def dumps(self, obj):
+        return self._orjson.dumps(obj, option=self._options)
+
+
+    def loads(self, data):
+        return self._orjson.loads(data)
+
+
+class MsgspecCodec:
+    '''
+    msgspec codec, decodes straight from bytes
+    '''
+    name = 'msgspec'
+
+    def __init__(self):
+        import msgspec
+        self._error = msgspec.DecodeError
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+
+
+    def dumps(self, obj):
+        return self._encoder.encode(obj)
+
+
+    def loads(self, data):
+        try:
+            return self._decoder.decode(data)
+        except self._error as e:
+            raise ValueError(str(e)) from e
+
+
+codecs = {
+    'orjson': OrjsonCodec,
+    'msgspec': MsgspecCodec,
+    'json': JsonCodec,
+    }
+
+
+def get_codec(codec=None):
+    '''
+    Returns a json codec: codec itself if it is a codec object, the named
+    codec ('orjson', 'msgspec' or 'json'), or with None the fastest installed one
+    '''
+    if codec is None:
+        for name in ('orjson', 'msgspec'):
+            try:
+                return codecs[name]()
+            except ImportError:
+                pass
+        return JsonCodec()
+    if isinstance(codec, str):
+        try:
+            return codecs[codec]()
+        except KeyError:
+            raise ValueError('unknown json codec: {0}'.format(codec))
+    return codec
@@ -13,4 +13,16 @@ class AuthorizationError(Exception):
 
 class HttpRequestError(Exception):
     def __init__(self,*args,**kwargs):
-        Exception.__init__(self,*args,**kwargs)
\ No newline at end of file
+        Exception.__init__(self,*args,**kwargs)
+
+class ServerError(HttpRequestError):
+    def __init__(self,*args,**kwargs):
+        HttpRequestError.__init__(self,*args,**kwargs)
+
+class CircuitOpenError(HttpRequestError):
+    def __init__(self,*args,**kwargs):
+        HttpRequestError.__init__(self,*args,**kwargs)
+
+class ReplayError(Exception):
+    def __init__(self,*args,**kwargs):
+        Exception.__init__(self,*args,**kwargs)
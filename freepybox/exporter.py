@@ -0,0 +1,212 @@
+'''
+Prometheus/OpenMetrics exporter serving freebox metrics on /metrics.
+    freepybox-exporter --host mafreebox.freebox.fr --port 443 --listen-port 9891
+'''
+import argparse
+import logging
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from freepybox.freepybox import Freepybox, token_file
+
+logger = logging.getLogger(__name__)
+
+class Exporter:
+    '''
+    Collects the freebox metrics with concurrent requests on one long-lived
+    session. Scrapes arriving within cache_ttl seconds share the same result.
+    '''
+    def __init__(self, fbx, cache_ttl=5, max_workers=8):
+        self.fbx = fbx
+        self.cache_ttl = cache_ttl
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._text = None
+        self._expires = 0
+
+
+    def collect(self):
+        '''
+        Returns the metrics in the Prometheus text format
+        '''
+        with self._lock:
+            if self._text is None or self._expires < time.monotonic():
+                self._text = self.scrape()
+                self._expires = time.monotonic() + self.cache_ttl
+            return self._text
+
+
+    def scrape(self):
+        '''
+        Query the freebox and render the metrics
+        '''
+        start = time.monotonic()
+        fbx = self.fbx
+        metrics = MetricSet()
+
+        system, connection, switch_status, ap_list = fbx.batch([
+            fbx.system.get_config,
+            fbx.connection.get_status_details,
+            fbx.switch.get_status,
+            fbx.wifi.get_ap_list,
+            ], self.max_workers)
+
+        ports = switch_status if isinstance(switch_status, list) else []
+        aps = ap_list if isinstance(ap_list, list) else []
+        details = fbx.batch(
+            [(fbx.switch.get_port_stats, p['id']) for p in ports] +
+            [(fbx.wifi.get_station_list, ap['id']) for ap in aps],
+            self.max_workers)
+        port_stats, stations = details[:len(ports)], details[len(ports):]
+
+        errors = 0
+        for result in [system, connection, switch_status, ap_list] + details:
+            if isinstance(result, Exception):
+                logger.warning('scrape request failed: {0!r}'.format(result))
+                errors += 1
+
+        if not isinstance(system, Exception):
+            self._system_metrics(metrics, system)
+        if not isinstance(connection, Exception):
+            self._connection_metrics(metrics, connection)
+        for port, stats in zip(ports, port_stats):
+            self._port_metrics(metrics, port, stats)
+        for ap, ap_stations in zip(aps, stations):
+            if not isinstance(ap_stations, Exception):
+                metrics.add('freebox_wifi_stations', 'gauge', 'Stations associated to the access point',
+                            len(ap_stations or []), ap=ap['id'])
+
+        metrics.add('freebox_scrape_errors', 'gauge', 'Failed requests during the last scrape', errors)
+        metrics.add('freebox_scrape_duration_seconds', 'gauge', 'Duration of the last scrape',
+                    time.monotonic() - start)
+        return metrics.render()
+
+
+    def _system_metrics(self, metrics, system):
+        for key, value in system.items():
+            if key.startswith('temp_'):
+                metrics.add('freebox_temperature_celsius', 'gauge', 'Temperature sensors', value,
+                            sensor=key[len('temp_'):])
+        for sensor in system.get('sensors') or []:
+            metrics.add('freebox_temperature_celsius', 'gauge', 'Temperature sensors', sensor.get('value'),
+                        sensor=sensor.get('id'))
+        if 'fan_rpm' in system:
+            metrics.add('freebox_fan_rpm', 'gauge', 'Fan speed', system['fan_rpm'])
+        for fan in system.get('fans') or []:
+            metrics.add('freebox_fan_rpm', 'gauge', 'Fan speed', fan.get('value'), fan=fan.get('id'))
+        if 'uptime_val' in system:
+            metrics.add('freebox_uptime_seconds', 'gauge', 'Time since the freebox booted', system['uptime_val'])
+
+
+    def _connection_metrics(self, metrics, connection):
+        metrics.add('freebox_connection_up', 'gauge', 'WAN connection state',
+                    1 if connection.get('state') == 'up' else 0, media=connection.get('media', ''))
+        for direction in ('up', 'down'):
+            metrics.add('freebox_connection_bytes_total', 'counter', 'WAN bytes transferred',
+                        connection.get('bytes_' + direction), direction=direction)
+            metrics.add('freebox_connection_rate_bytes', 'gauge', 'WAN current rate in bytes per second',
+                        connection.get('rate_' + direction), direction=direction)
+            metrics.add('freebox_connection_bandwidth_bits', 'gauge', 'WAN available bandwidth in bits per second',
+                        connection.get('bandwidth_' + direction), direction=direction)
+
+
+    def _port_metrics(self, metrics, port, stats):
+        metrics.add('freebox_switch_port_up', 'gauge', 'Switch port link state',
+                    1 if port.get('link') == 'up' else 0, port=port['id'])
+        if isinstance(stats, Exception):
+            return
+        metrics.add('freebox_switch_port_bytes_total', 'counter', 'Switch port bytes',
+                    stats.get('rx_good_bytes'), port=port['id'], direction='rx')
+        metrics.add('freebox_switch_port_bytes_total', 'counter', 'Switch port bytes',
+                    stats.get('tx_bytes'), port=port['id'], direction='tx')
+        metrics.add('freebox_switch_port_packets_total', 'counter', 'Switch port packets',
+                    stats.get('rx_good_packets'), port=port['id'], direction='rx')
+        metrics.add('freebox_switch_port_packets_total', 'counter', 'Switch port packets',
+                    stats.get('tx_packets'), port=port['id'], direction='tx')
+        metrics.add('freebox_switch_port_errors_total', 'counter', 'Switch port receive errors',
+                    stats.get('rx_err_packets'), port=port['id'])
+
+
+class MetricSet:
+    '''
+    Metrics samples grouped by name, rendered in the Prometheus text format
+    '''
+    def __init__(self):
+        self._metrics = {}
+
+
+    def add(self, name, kind, help, value, **labels):
+        if value is None:
+            return
+        if name not in self._metrics:
+            self._metrics[name] = (kind, help, [])
+        self._metrics[name][2].append((labels, value))
+
+
+    def render(self):
+        lines = []
+        for name, (kind, help, samples) in self._metrics.items():
+            lines.append('# HELP {0} {1}'.format(name, help))
+            lines.append('# TYPE {0} {1}'.format(name, kind))
+            for labels, value in samples:
+                label_str = ','.join('{0}="{1}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                                     for k, v in sorted(labels.items()))
+                lines.append('{0}{1} {2}'.format(name, '{' + label_str + '}' if label_str else '', float(value)))
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    exporter = None
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        try:
+            body = self.exporter.collect().encode('utf-8')
+        except Exception as e:
+            logger.exception('scrape failed')
+            self.send_error(503, str(e))
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Prometheus exporter for the Freebox')
+    parser.add_argument('--host', default='mafreebox.freebox.fr', help='freebox host')
+    parser.add_argument('--port', type=int, default=443, help='freebox HTTPS port')
+    parser.add_argument('--api-version', default='v3', help='freebox API version')
+    parser.add_argument('--token-file', default=token_file, help='application token file')
+    parser.add_argument('--listen-address', default='', help='address to serve /metrics on')
+    parser.add_argument('--listen-port', type=int, default=9891, help='port to serve /metrics on')
+    parser.add_argument('--cache-ttl', type=float, default=5, help='seconds a scrape result is reused')
+    parser.add_argument('--max-workers', type=int, default=8, help='concurrent requests per scrape')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+
+    fbx = Freepybox(token_file=args.token_file, api_version=args.api_version)
+    fbx.open(args.host, args.port)
+
+    MetricsHandler.exporter = Exporter(fbx, args.cache_ttl, args.max_workers)
+    server = ThreadingHTTPServer((args.listen_address, args.listen_port), MetricsHandler)
+    logger.info('Serving metrics on {0}:{1}/metrics'.format(args.listen_address, args.listen_port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        fbx.close(logout=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from freepybox.access import request_deadline
+from freepybox.freepybox import Freepybox
+
+logger = logging.getLogger(__name__)
+
+class FreeboxFleet:
+    '''
+    Many freeboxes opened and queried concurrently over one bounded thread pool.
+    Each box has its own Freepybox (token file, api version, session),
+    options given to the fleet are passed to every Freepybox: use
+    circuit_breaker=True for a circuit breaker per box.
+        fleet = FreeboxFleet(max_workers=32, timeout=5)
+        fleet.add('paris', 'paris.example.net', 443, token_file='paris.auth', api_version='v6')
+        fleet.add('lyon', 'lyon.example.net', 443, token_file='lyon.auth')
+        fleet.open()
+        for name, result in fleet.run('connection.get_status_details'):
+            ...
+        fleet.close()
+    The application must already be authorized on every box (token files).
+    '''
+    def __init__(self, max_workers=32, **options):
+        self.max_workers = max_workers
+        self.options = options
+        self.boxes = {}
+        self.errors = {}
+        self._addresses = {}
+        self._opened = set()
+        self._executor = None
+
+
+    def add(self, name, host, port, **options):
+        '''
+        Add a box to the fleet, options override the fleet Freepybox options
+        (token_file, api_version, timeout...)
+        '''
+        self.boxes[name] = Freepybox(**{**self.options, **options})
+        self._addresses[name] = (host, port)
+
+
+    def open(self, names=None):
+        '''
+        Open the boxes concurrently.
+        Returns {name: exception} for the boxes which could not be opened,
+        they are left out of run() until opened again.
+        '''
+        errors = {}
+        for name, result in self._as_completed(self._select(names, opened=False), self._open_box):
+            if isinstance(result, Exception):
+                logger.warning('{0}: open failed: {1}'.format(name, result))
+                errors[name] = result
+            else:
+                self._opened.add(name)
+        self.errors.update(errors)
+        return errors
+
+
+    def run(self, call, *args, names=None, timeout=None):
+        '''
+        Run call on every opened box and yield (name, result) as the boxes answer,
+        a failing box gives the raised exception as result.
+        call is a module method path such as 'connection.get_status_details'
+        or a callable taking the Freepybox as first argument.
+        timeout: seconds each box has to answer, counted from the start of
+        its call rather than from its wait for a worker. The requests of a
+        box give up at its deadline, so a box past it gives a TimeoutError
+        and frees its worker for the next boxes.
+        '''
+        return self._as_completed(self._select(names, opened=True), self._call_box, call, args, timeout=timeout)
+
+
+    def close(self, logout=True):
+        '''
+        Close the opened boxes and the worker pool
+        '''
+        for name, result in self._as_completed(self._select(None, opened=True), self._close_box, logout):
+            if isinstance(result, Exception):
+                logger.warning('{0}: close failed: {1}'.format(name, result))
+        self._opened.clear()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+    def _select(self, names, opened):
+        names = self.boxes if names is None else names
+        return [n for n in names if (n in self._opened) == opened]
+
+
+    def _open_box(self, name):
+        self.boxes[name].open(*self._addresses[name])
+        self.errors.pop(name, None)
+
+
+    def _close_box(self, name, logout):
+        self.boxes[name].close(logout)
+
+
+    def _call_box(self, name, call, args):
+        fbx = self.boxes[name]
+        if callable(call):
+            return call(fbx, *args)
+        target = fbx
+        for attr in call.split('.'):
+            target = getattr(target, attr)
+        return target(*args)
+
+
+    def _as_completed(self, names, fn, *args, timeout=None):
+        '''
+        Submit fn(name, *args) for every name to the shared pool
+        and yield (name, result or exception) as they complete, a call
+        running for more than timeout seconds gives a TimeoutError
+        '''
+        if not names:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='fleet')
+
+        # Deadline of each started call, the requests of the call give up at it
+        deadlines = {}
+
+        def call(name):
+            if timeout is not None:
+                deadlines[name] = time.monotonic() + timeout
+                request_deadline.set(deadlines[name])
+            return fn(name, *args)
+
+        # Each call runs in a copy of the caller context, for priority()
+        futures = {self._executor.submit(contextvars.copy_context().run, call, name): name for name in names}
+        try:
+            while futures:
+                wait_timeout = None
+                if timeout is not None:
+                    now = time.monotonic()
+                    for future, name in list(futures.items()):
+                        if name in deadlines and deadlines[name] <= now and not future.done():
+                            del futures[future]
+                            yield name, TimeoutError('no answer within {0}s'.format(timeout))
+                    # Wake up at the next deadline, or after timeout to see the calls started meanwhile
+                    wait_timeout = max(0, min([deadlines[n] - now for n in futures.values() if n in deadlines] + [timeout]))
+
+                done, _ = wait(futures, wait_timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = futures.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = e
+                    yield name, result
+        finally:
+            for future in futures:
+                future.cancel()
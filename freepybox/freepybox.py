@@ -1,8 +1,7 @@
-import requests
-import hmac
+import contextlib
+import importlib
 import time
 import json
-import ipaddress
 import logging
 import os
 import socket
@@ -10,19 +9,10 @@ from urllib.parse import urljoin
 import freepybox
 from freepybox.exceptions import *
 from freepybox.access import Access
-from freepybox.api.system import System
-from freepybox.api.connection import Connection
-from freepybox.api.dhcp import Dhcp
-from freepybox.api.switch import Switch
-from freepybox.api.lan import Lan
-from freepybox.api.wifi import Wifi
-from freepybox.api.fs import Fs
-from freepybox.api.fsnav import Fsnav
-from freepybox.api.call import Call
-from freepybox.api.fw import Fw
-from freepybox.api.phone import Phone
-from freepybox.api.airmedia import Airmedia
-from freepybox.api.freeplugs import Freeplugs
+from freepybox.batch import run_batch
+from freepybox.transport import Transport
+from freepybox.retry import RetryPolicy, CircuitBreaker
+from freepybox.codec import get_codec
 
 
 # Token file default location
@@ -30,6 +20,9 @@ token_filename = 'app_auth'
 token_dir = os.path.dirname(os.path.abspath(__file__))
 token_file = os.path.join(token_dir, token_filename)
 
+# Freebox root certificate authority
+root_ca_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'freebox_root_ca.pem')
+
 # Default application descriptor
 app_desc = {
     'app_id':'fpbx',
@@ -38,14 +31,57 @@ app_desc = {
     'device_name':socket.gethostname()
     }
 
+# Freebox modules, imported and instantiated on first access: attribute -> (module, class)
+modules = {
+    'system': ('freepybox.api.system', 'System'),
+    'connection': ('freepybox.api.connection', 'Connection'),
+    'dhcp': ('freepybox.api.dhcp', 'Dhcp'),
+    'switch': ('freepybox.api.switch', 'Switch'),
+    'lan': ('freepybox.api.lan', 'Lan'),
+    'wifi': ('freepybox.api.wifi', 'Wifi'),
+    'fs': ('freepybox.api.fs', 'Fs'),
+    'call': ('freepybox.api.call', 'Call'),
+    'fsnav': ('freepybox.api.fsnav', 'Fsnav'),
+    'fw': ('freepybox.api.fw', 'Fw'),
+    'phone': ('freepybox.api.phone', 'Phone'),
+    'airmedia': ('freepybox.api.airmedia', 'Airmedia'),
+    'freeplugs': ('freepybox.api.freeplugs', 'Freeplugs'),
+    'event': ('freepybox.api.event', 'Event'),
+    'rrd': ('freepybox.api.rrd', 'Rrd'),
+    }
+
 logger = logging.getLogger(__name__)
 
 class Freepybox:
-    def __init__(self, app_desc=app_desc, token_file=token_file, api_version='v3', timeout=10):
+    def __init__(self, app_desc=app_desc, token_file=token_file, api_version='v3', timeout=10, session_ttl=1800, cache_ttl=None, cache_size=128, transport=None, retry=None, circuit_breaker=None, rate_limit=None, json_codec=None, hooks=None):
         self.token_file = token_file
         self.api_version = api_version
         self.timeout = timeout
         self.app_desc = app_desc
+        self.session_ttl = session_ttl
+        self._access = None
+        # Opt-in GET response cache, cache_ttl maps endpoint prefixes to a TTL in seconds
+        self._cache = None
+        if cache_ttl:
+            from freepybox.cache import ResponseCache
+            self._cache = ResponseCache(cache_ttl, cache_size)
+        # Connection pooling, keep-alive, socket retries and HTTP/2 options
+        self.transport = transport or Transport()
+        # Opt-in retries of idempotent requests (RetryPolicy) and fail fast
+        # when the box is unreachable (CircuitBreaker), True for the defaults
+        self.retry = RetryPolicy() if retry is True else retry
+        self.circuit_breaker = CircuitBreaker() if circuit_breaker is True else circuit_breaker
+        # Opt-in client side RateLimiter, can be shared by several Freepybox
+        self.rate_limit = rate_limit
+        # Codec of the request and response bodies: None for the fastest
+        # installed of orjson/msgspec/json, a codec name or a codec object
+        self.json_codec = json_codec
+        # Instrumentation hooks (see freepybox.instrument.Recorder) and
+        # the seconds spent in each phase of the last open(), the session
+        # renewals after it are not timed
+        self.hooks = list(hooks or [])
+        self.open_timings = {}
+        self._timing_open = False
 
     def open(self, host, port):
         '''
@@ -54,34 +90,90 @@ class Freepybox:
         '''
         if not self._is_app_desc_valid(self.app_desc): raise InvalidTokenError('invalid application descriptor')
 
-        self.session = requests.Session()
-        self.session.verify = os.path.join(os.path.dirname(__file__), 'freebox_root_ca.pem')
+        self.open_timings = {}
+        self._timing_open = True
+        start = time.perf_counter()
+        try:
+            with self._phase('transport'):
+                self.session = self.transport.create_session(root_ca_file)
+
+            self._access = self._get_freebox_access(host, port, self.api_version, self.token_file, self.app_desc, self.timeout)
+        finally:
+            self._timing_open = False
+
+        # Freebox modules are instantiated on first access
+        self._init_modules()
+        self._end_open(start)
+
+
+    @contextlib.contextmanager
+    def _phase(self, name):
+        '''
+        Add the time spent in the block to open_timings[name] during open()
+        '''
+        if not self._timing_open:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.open_timings[name] = self.open_timings.get(name, 0) + time.perf_counter() - start
+
 
-        self._access = self._get_freebox_access(host, port, self.api_version, self.token_file, self.app_desc, self.timeout)
+    def _end_open(self, start):
+        '''
+        Record the open() total time and give the timings to the hooks
+        '''
+        self.open_timings['total'] = time.perf_counter() - start
+        logger.debug('Open timings: ' + str(self.open_timings))
+        for hook in self.hooks:
+            if hasattr(hook, 'after_open'):
+                hook.after_open(self.open_timings)
+
+
+    def _init_modules(self):
+        '''
+        Drop the freebox modules of a previous access, they are
+        instantiated again on first access
+        '''
+        for name in modules:
+            self.__dict__.pop(name, None)
 
-        # Instantiate freebox modules
-        self.system = System(self._access)
-        self.connection = Connection(self._access)
-        self.dhcp = Dhcp(self._access)
-        self.switch = Switch(self._access)
-        self.lan = Lan(self._access)
-        self.wifi = Wifi(self._access)
-        self.fs = Fs(self._access)
-        self.call = Call(self._access)
-        self.fsnav = Fsnav(self._access)
-        self.fw = Fw(self._access)
-        self.phone = Phone(self._access)
-        self.airmedia = Airmedia(self._access)
-        self.freeplugs = Freeplugs(self._access)
+
+    def __getattr__(self, name):
+        '''
+        Import and instantiate a freebox module on first access
+        '''
+        if name in modules and self.__dict__.get('_access') is not None:
+            module_name, class_name = modules[name]
+            module = getattr(importlib.import_module(module_name), class_name)(self._access)
+            setattr(self, name, module)
+            return module
+        raise AttributeError("'{0}' object has no attribute '{1}'".format(type(self).__name__, name))
 
 
-    def close(self):
+    def close(self, logout=True):
         '''
-        Close the freebox session
+        Close the freebox session.
+        With logout=False the session is kept open on the freebox
+        so that the token stored in token_file can be reused by the next open()
         '''
         if self._access is None: raise NotOpenError('Freebox is Not opened')
 
-        self._access.post('login/logout')
+        if logout:
+            self._access.post('login/logout')
+            self._writefile_session_token(None, None, self.token_file)
+
+
+    def batch(self, calls, max_workers=8):
+        '''
+        Run module calls in parallel on the opened session.
+        calls is a list of callables or (callable, arg1, ...) tuples:
+            fbx.batch([fbx.system.get_config, (fbx.switch.get_port_stats, 1)])
+        Returns results in the same order, a failing call gives its exception.
+        '''
+        return run_batch(calls, max_workers)
 
 
     def _get_freebox_access(self, host, port, api_version, token_file, app_desc, timeout=10):
@@ -91,55 +183,105 @@ class Freepybox:
 
         base_url = self._get_base_url(host, port, api_version)
 
-        # Read stored application token
+        # If no valid token is stored then request a token to freebox api - Only for LAN connection
+        app_token = self._read_app_token(token_file, app_desc)
+        if app_token is None:
+            with self._phase('authorize'):
+                app_token, track_id = self._get_app_token(base_url, app_desc, timeout)
+
+                # The user must accept the app request on the freebox
+                prompted = False
+                while self._authorization_pending(self._get_authorization_status(base_url, track_id, timeout), prompted):
+                    prompted = True
+                    time.sleep(1)
+
+                self._store_app_token(app_token, track_id, app_desc, token_file)
+
+        # Reuse the session token stored in file, or get a token for a new session
+        session_token = self._read_session(token_file)
+        if session_token is None:
+            session_token = self._store_session(self._get_session_token(base_url, app_token, app_desc['app_id'], timeout), token_file)
+
+        def renew_session():
+            logger.info('Session expired, opening a new session')
+            return self._store_session(self._get_session_token(base_url, app_token, app_desc['app_id'], timeout), token_file)
+
+        return self._create_access(Access, base_url, session_token, timeout, renew_session)
+
+
+    def _read_app_token(self, token_file, app_desc):
+        '''
+        Returns the application token stored in token_file, None when there
+        is none for app_desc and the application must be authorized
+        '''
         logger.info('Read application authorization file')
         app_token, track_id, file_app_desc = self._readfile_app_token(token_file)
-
-        # If no valid token is stored then request a token to freebox api - Only for LAN connection
         if app_token is None or file_app_desc != app_desc:
-                logger.info('No valid authorization file found')
+            logger.info('No valid authorization file found')
+            return None
+        return app_token
 
-                # Get application token from the freebox
-                app_token, track_id = self._get_app_token(base_url, app_desc, timeout)
 
-                # Check the authorization status
-                out_msg_flag = False
-                status = None
-                while(status != 'granted'):
-                    status = self._get_authorization_status(base_url, track_id, timeout)
+    def _authorization_pending(self, status, prompted):
+        '''
+        Returns True while the authorization request waits for the user,
+        who is asked to confirm it when not prompted yet.
+        Raise AuthorizationError when the authorization failed.
+        '''
+        # denied status = authorization failed
+        if status == 'denied':
+            raise AuthorizationError('the app_token is invalid or has been revoked')
 
-                    # denied status = authorization failed
-                    if status == 'denied':
-                        raise AuthorizationError('the app_token is invalid or has been revoked')
+        # timeout = authorization failed
+        if status == 'timeout':
+            raise AuthorizationError('timeout')
 
-                    # Pending status : user must accept the app request on the freebox
-                    elif status == 'pending':
-                        if not out_msg_flag:
-                            out_msg_flag = True
-                            print('Please confirm the authentification on the freebox')
-                        time.sleep(1)
+        # Pending status : user must accept the app request on the freebox
+        if status == 'pending' and not prompted:
+            print('Please confirm the authentification on the freebox')
 
-                    # timeout = authorization failed
-                    elif status == 'timeout':
-                        raise AuthorizationError('timeout')
+        return status != 'granted'
 
-                logger.info('Application authorization granted')
 
-                # Store application token in file
-                self._writefile_app_token(app_token, track_id, app_desc, token_file)
-                logger.info('Application token file was generated : {0}'.format(token_file))
+    def _store_app_token(self, app_token, track_id, app_desc, token_file):
+        '''
+        Store the granted application token in token_file
+        '''
+        logger.info('Application authorization granted')
+        self._writefile_app_token(app_token, track_id, app_desc, token_file)
+        logger.info('Application token file was generated : {0}'.format(token_file))
 
 
-        # Get token for the current session
-        session_token, session_permissions = self._get_session_token(base_url, app_token, app_desc['app_id'], timeout)
+    def _read_session(self, token_file):
+        '''
+        Returns the session token stored in token_file, None when there is
+        no stored session or it has expired
+        '''
+        session_token, session_permissions = self._readfile_session_token(token_file)
+        if session_token is not None:
+            logger.info('Session reused from authorization file')
+            logger.info('Permissions: ' + str(session_permissions))
+        return session_token
 
+
+    def _store_session(self, session, token_file):
+        '''
+        Store the (session_token, session_permissions) of a new session in
+        token_file and returns the session token
+        '''
+        session_token, session_permissions = session
+        self._writefile_session_token(session_token, session_permissions, token_file)
         logger.info('Session opened')
         logger.info('Permissions: ' + str(session_permissions))
+        return session_token
 
-        # Create freebox http access module
-        fbx_access = Access(self.session, base_url, session_token, timeout)
 
-        return fbx_access
+    def _create_access(self, access_class, base_url, session_token, timeout, renew_session):
+        '''
+        Returns the access_class (Access or AsyncAccess) of the session
+        '''
+        return access_class(self.session, base_url, session_token, timeout, renew_session, self._cache, self.retry,
+                            self.circuit_breaker, self.rate_limit, get_codec(self.json_codec), self.hooks)
 
 
     def _get_authorization_status(self, base_url, track_id, timeout):
@@ -167,8 +309,13 @@ class Freepybox:
         url = urljoin(base_url, 'login/authorize/')
         data = json.dumps(app_desc)
         r = self.session.post(url, data, timeout=timeout)
-        resp = r.json()
+        return self._app_token_result(r.json())
+
 
+    def _app_token_result(self, resp):
+        '''
+        Returns (app_token, track_id) of a login/authorize/ answer
+        '''
         # raise exception if resp.success != True
         if not resp.get('success'):
             raise AuthorizationError('authentification failed')
@@ -206,23 +353,77 @@ class Freepybox:
             return (None, None, None)
 
 
+    def _writefile_session_token(self, session_token, session_permissions, file):
+        """
+        Store the session token, its permissions and an expiry hint next
+        to the application token. A None session_token removes the stored session.
+        """
+        try:
+            with open(file, 'r') as f:
+                d = json.load(f)
+        except FileNotFoundError:
+            return
+
+        for k in ('session_token', 'session_permissions', 'session_expires'):
+            d.pop(k, None)
+        if session_token is not None:
+            d['session_token'] = session_token
+            d['session_permissions'] = session_permissions
+            d['session_expires'] = time.time() + self.session_ttl
+
+        # Write then rename so a concurrent open() never reads a partial file
+        tmp_file = '{0}.tmp{1}'.format(file, os.getpid())
+        with open(tmp_file, 'w') as f:
+            json.dump(d, f)
+        os.replace(tmp_file, file)
+
+
+    def _readfile_session_token(self, file):
+        """
+        Read the session token stored in file.
+        Returns (session_token, session_permissions), (None, None) if
+        there is no stored session or it has expired
+        """
+        try:
+            with open(file, 'r') as f:
+                d = json.load(f)
+        except FileNotFoundError:
+            return (None, None)
+
+        if d.get('session_token') is None or d.get('session_expires', 0) < time.time():
+            return (None, None)
+
+        return (d['session_token'], d.get('session_permissions'))
+
+
     def _get_session_token(self, base_url, app_token, app_id, timeout=10):
         """
         Get session token from freebox.
         Returns (session_token, session_permissions)
         """
         # Get challenge from API
-        challenge = self._get_challenge(base_url, timeout)
+        with self._phase('challenge'):
+            challenge = self._get_challenge(base_url, timeout)
+
+        url = urljoin(base_url, 'login/session/')
+        with self._phase('session'):
+            r = self.session.post(url, self._session_request(app_token, app_id, challenge), timeout=timeout)
+            return self._session_result(r.json())
+
 
+    def _session_request(self, app_token, app_id, challenge):
+        '''
+        Returns the login/session/ request body for challenge
+        '''
         # Hash app_token with chalenge key to get the password
-        h = hmac.new(app_token.encode(), challenge.encode(), 'sha1')
-        password = h.hexdigest()
+        password = self._get_password(app_token, challenge)
+        return json.dumps({'app_id': app_id, 'password': password})
 
-        url = urljoin(base_url, 'login/session/')
-        data = json.dumps({'app_id': app_id, 'password': password})
-        r = self.session.post(url, data, timeout=timeout)
-        resp = r.json()
 
+    def _session_result(self, resp):
+        '''
+        Returns (session_token, session_permissions) of a login/session/ answer
+        '''
         # raise exception if resp.success != True
         if not resp.get('success'):
             raise AuthorizationError('get_session_token failed')
@@ -233,14 +434,28 @@ class Freepybox:
         return(session_token, session_permissions)
 
 
+    def _get_password(self, app_token, challenge):
+        '''
+        Return the session password: HMAC-SHA1 of the challenge keyed with app_token
+        '''
+        import hmac
+        h = hmac.new(app_token.encode(), challenge.encode(), 'sha1')
+        return h.hexdigest()
+
+
     def _get_challenge(self, base_url, timeout=10):
         '''
         Return challenge from freebox API
         '''
         url = urljoin(base_url, 'login')
         r = self.session.get(url, timeout=timeout)
-        resp = r.json()
+        return self._challenge_result(r.json())
+
 
+    def _challenge_result(self, resp):
+        '''
+        Returns the challenge of a login answer
+        '''
         # raise exception if resp.success != True
         if not resp.get('success'):
             raise AuthorizationError('get_challenge failed')
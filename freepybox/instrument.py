@@ -0,0 +1,183 @@
+import bisect
+import re
+import threading
+import time
+
+# Latency histogram bucket upper bounds in milliseconds
+latency_buckets = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, float('inf'))
+
+# Path segments of the API words (lan, browser, pub, static_lease, ipv6...),
+# any other segment is an id, a mac address or a base64 path
+_word_segment = re.compile(r'^(?:[a-z][a-z0-9_]*)?$')
+
+
+def endpoint_template(end_url):
+    '''
+    Returns end_url with its ids replaced by {id}, so that the requests
+    to the same endpoint are accounted together:
+        switch/port/3/stats/ -> switch/port/{id}/stats/
+        connection/ipv6/config/ -> connection/ipv6/config/
+        fs/ls/L0Rpc3F1ZSBkdXI= -> fs/ls/{id}
+    '''
+    path = end_url.split('?', 1)[0]
+    return '/'.join(s if _word_segment.match(s) else '{id}' for s in path.split('/'))
+
+
+class RequestInfo:
+    '''
+    A request sent by Access, given to the hooks:
+        method, end_url, endpoint (template of end_url), request_size
+        status, response_size, elapsed (seconds) once the answer is received
+        error: freebox error_code or exception class name of a failed request
+    '''
+    __slots__ = ('method', 'end_url', 'endpoint', 'request_size', 'start',
+                 'elapsed', 'status', 'response_size', 'error')
+
+    def __init__(self, method, end_url, request_size):
+        self.method = method
+        self.end_url = end_url
+        self.endpoint = endpoint_template(end_url)
+        self.request_size = request_size
+        self.start = time.perf_counter()
+        self.elapsed = None
+        self.status = None
+        self.response_size = 0
+        self.error = None
+
+
+class LatencyHistogram:
+    '''
+    Counts of latencies per bucket of latency_buckets
+    '''
+    def __init__(self):
+        self.counts = [0] * len(latency_buckets)
+        self.count = 0
+        self.sum = 0.0
+
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(latency_buckets, ms)] += 1
+        self.count += 1
+        self.sum += ms
+
+
+    def percentile(self, q):
+        '''
+        Returns the upper bound of the bucket holding the q (0-100) percentile
+        '''
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for bound, n in zip(latency_buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return latency_buckets[-1]
+
+
+class EndpointStats:
+    '''
+    Counters of the requests sent to one method and endpoint template
+    '''
+    def __init__(self):
+        self.count = 0
+        self.errors = {}
+        self.latency = LatencyHistogram()
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+
+class Recorder:
+    '''
+    Low overhead hook accounting the requests per method and endpoint
+    template: counts, latency histograms, sizes and error codes, along
+    with the phase timings of the last Freepybox.open().
+        recorder = Recorder()
+        fbx = Freepybox(hooks=[recorder])
+        ...
+        print(recorder.report())
+    '''
+    def __init__(self):
+        self.stats = {}
+        self.open_timings = {}
+        self._lock = threading.Lock()
+
+
+    def after_request(self, info):
+        with self._lock:
+            stats = self.stats.get((info.method, info.endpoint))
+            if stats is None:
+                stats = self.stats[(info.method, info.endpoint)] = EndpointStats()
+            stats.count += 1
+            stats.latency.add(info.elapsed * 1000)
+            stats.request_bytes += info.request_size
+            stats.response_bytes += info.response_size
+            if info.error is not None:
+                stats.errors[info.error] = stats.errors.get(info.error, 0) + 1
+
+
+    def after_open(self, timings):
+        self.open_timings = dict(timings)
+
+
+    def reset(self):
+        with self._lock:
+            self.stats = {}
+
+
+    def snapshot(self):
+        '''
+        Returns {(method, endpoint): {'count', 'errors', 'latency_ms': {'sum', 'p50', 'p90', 'p99',
+        'buckets'}, 'request_bytes', 'response_bytes'}}
+        '''
+        with self._lock:
+            return {key: {
+                'count': s.count,
+                'errors': dict(s.errors),
+                'latency_ms': {'sum': s.latency.sum, 'p50': s.latency.percentile(50), 'p90': s.latency.percentile(90),
+                               'p99': s.latency.percentile(99), 'buckets': list(zip(latency_buckets, s.latency.counts))},
+                'request_bytes': s.request_bytes,
+                'response_bytes': s.response_bytes,
+                } for key, s in self.stats.items()}
+
+
+    def report(self):
+        '''
+        Returns a text table of the endpoints, the most time consuming first
+        '''
+        snapshot = self.snapshot()
+        lines = ['{0:<6} {1:<40} {2:>7} {3:>7} {4:>10} {5:>8} {6:>8} {7:>10}  {8}'.format(
+            'method', 'endpoint', 'count', 'errors', 'total ms', 'p50 ms', 'p99 ms', 'kB in', 'error codes')]
+        for (method, endpoint), s in sorted(snapshot.items(), key=lambda i: -i[1]['latency_ms']['sum']):
+            lines.append('{0:<6} {1:<40} {2:>7} {3:>7} {4:>10.1f} {5:>8} {6:>8} {7:>10.1f}  {8}'.format(
+                method, endpoint, s['count'], sum(s['errors'].values()), s['latency_ms']['sum'],
+                s['latency_ms']['p50'], s['latency_ms']['p99'], s['response_bytes'] / 1024,
+                ' '.join('{0}={1}'.format(k, v) for k, v in s['errors'].items())))
+        if self.open_timings:
+            lines.append('open: ' + ', '.join('{0} {1:.1f} ms'.format(k, v * 1000) for k, v in self.open_timings.items()))
+        return '\n'.join(lines)
+
+
+def before_request(hooks, method, end_url, data):
+    '''
+    Returns the RequestInfo of a request about to be sent, given to the
+    before_request method of the hooks having one
+    '''
+    info = RequestInfo(method, end_url, len(data) if data else 0)
+    for hook in hooks:
+        if hasattr(hook, 'before_request'):
+            hook.before_request(info)
+    return info
+
+
+def after_request(hooks, info, error=None):
+    '''
+    Complete info with the elapsed time and error, and give it to
+    the after_request method of the hooks having one
+    '''
+    info.elapsed = time.perf_counter() - info.start
+    info.error = error
+    for hook in hooks:
+        if hasattr(hook, 'after_request'):
+            hook.after_request(info)
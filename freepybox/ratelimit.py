@@ -0,0 +1,147 @@
+import contextlib
+import contextvars
+import threading
+import time
+
+# Set by priority() for the calls made in the current thread or asyncio task,
+# copied to the workers of run_batch, Fs.walk, FsIndex and FreeboxFleet
+_priority = contextvars.ContextVar('freepybox_priority', default=False)
+
+
+@contextlib.contextmanager
+def priority():
+    '''
+    Requests sent inside the block go ahead of the background ones
+    waiting on the rate limiter:
+        with priority():
+            fbx.lan.get_hosts_list()
+    '''
+    token = _priority.set(True)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    '''
+    rate requests per second on average, bursts of up to burst requests
+    '''
+    def __init__(self, rate, burst=None):
+        if not rate > 0:
+            raise ValueError('rate must be positive, got {0}'.format(rate))
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+    def delay(self):
+        '''
+        Returns the seconds until a token is available
+        '''
+        return max(0, (1 - self.tokens) / self.rate)
+
+
+class RateLimiter:
+    '''
+    Client side token bucket rate limiting of the requests sent to a box,
+    shared by all the threads and tasks using it (one limiter can be given
+    to several Freepybox of the same process):
+        rate, burst: global limit in requests per second and burst size
+        limits: per endpoint prefix limits {prefix: rate or (rate, burst)},
+            the longest matching prefix applies on top of the global limit
+    Requests sent in a priority() block are served before the waiting ones.
+        RateLimiter(rate=20, limits={'lan/browser/': 2, 'wifi/': (2, 5)})
+    '''
+    def __init__(self, rate=None, burst=None, limits=None):
+        self._global = TokenBucket(rate, burst) if rate else None
+        self._buckets = {}
+        for prefix, limit in (limits or {}).items():
+            self._buckets[prefix] = TokenBucket(*limit) if isinstance(limit, tuple) else TokenBucket(limit)
+        self._prefixes = sorted(self._buckets, key=len, reverse=True)
+        self._priority_waiters = 0
+        self._cond = threading.Condition()
+
+
+    def acquire(self, end_url):
+        '''
+        Block until a request to end_url can be sent
+        '''
+        is_priority = self._enter()
+        try:
+            with self._cond:
+                while True:
+                    delay = self._try_acquire(end_url, is_priority)
+                    if delay == 0:
+                        return
+                    self._cond.wait(delay)
+        finally:
+            self._leave(is_priority)
+
+
+    async def acquire_async(self, end_url):
+        '''
+        Wait without blocking the event loop until a request to end_url can be sent
+        '''
+        import asyncio
+
+        is_priority = self._enter()
+        try:
+            while True:
+                with self._cond:
+                    delay = self._try_acquire(end_url, is_priority)
+                if delay == 0:
+                    return
+                await asyncio.sleep(delay)
+        finally:
+            self._leave(is_priority)
+
+
+    def _enter(self):
+        is_priority = _priority.get()
+        if is_priority:
+            with self._cond:
+                self._priority_waiters += 1
+        return is_priority
+
+
+    def _leave(self, is_priority):
+        if is_priority:
+            with self._cond:
+                self._priority_waiters -= 1
+                self._cond.notify_all()
+
+
+    def _match(self, end_url):
+        for prefix in self._prefixes:
+            if end_url.startswith(prefix):
+                return self._buckets[prefix]
+        return None
+
+
+    def _try_acquire(self, end_url, is_priority):
+        '''
+        Take a token from the global and the endpoint buckets, must be called
+        with the lock held. Returns 0 on success, else the seconds to wait.
+        '''
+        buckets = [b for b in (self._global, self._match(end_url)) if b is not None]
+        now = time.monotonic()
+        for bucket in buckets:
+            bucket.refill(now)
+        delay = max([b.delay() for b in buckets] + [0])
+
+        # Background requests leave the next tokens to the priority ones
+        if not is_priority and self._priority_waiters:
+            return max(delay, 0.01)
+        if delay > 0:
+            return delay
+
+        for bucket in buckets:
+            bucket.tokens -= 1
+        return 0
@@ -0,0 +1,308 @@
+import base64
+import gzip
+import io
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+from freepybox.exceptions import *
+from freepybox.transport import Transport, SessionBase
+
+# Keys whose values are replaced in the recorded bodies
+redacted_keys = ('session_token', 'app_token', 'password')
+redacted_value = '<redacted>'
+
+# Response headers kept in the recordings
+recorded_headers = ('Content-Type', 'Content-Range')
+
+
+def open_recording(path, mode):
+    '''
+    Open a recording file in text mode, gzip compressed when path ends with .gz
+    '''
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def load_recording(path):
+    '''
+    Returns the records of a recording file. A recording cut short,
+    by a process killed without closing its session, is read up to its end.
+    '''
+    records = []
+    with open_recording(path, 'r') as f:
+        try:
+            for line in f:
+                if line.strip():
+                    records.append(json.loads(line))
+        except (EOFError, json.JSONDecodeError):
+            pass
+    return records
+
+
+def _url_path(url):
+    '''
+    Returns the path and query of url: /api/v3/lan/browser/pub/
+    '''
+    parts = urlsplit(url)
+    return parts.path + ('?' + parts.query if parts.query else '')
+
+
+def _redact(body):
+    '''
+    Returns the json body with the tokens and passwords replaced
+    '''
+    if not body or not any(k.encode() in body for k in redacted_keys):
+        return body
+    try:
+        obj = json.loads(body)
+    except ValueError:
+        return body
+
+    def walk(value):
+        if isinstance(value, dict):
+            return {k: redacted_value if k in redacted_keys else walk(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [walk(v) for v in value]
+        return value
+
+    return json.dumps(walk(obj)).encode()
+
+
+def _encode_body(body, name):
+    '''
+    Returns the record fields of body: text when it is utf-8, base64 otherwise
+    '''
+    if body is None:
+        return {}
+    if isinstance(body, str):
+        body = body.encode()
+    body = _redact(body)
+    try:
+        return {name: body.decode('utf-8')}
+    except UnicodeDecodeError:
+        return {name + '_b64': base64.b64encode(body).decode()}
+
+
+def _decode_body(record, name):
+    if name in record:
+        return record[name].encode('utf-8')
+    if name + '_b64' in record:
+        return base64.b64decode(record[name + '_b64'])
+    return b''
+
+
+class RecordingTransport(Transport):
+    '''
+    Transport recording the requests of a blocking Freepybox and the box
+    answers as json lines, gzip compressed when path ends with .gz.
+    Session token, app token and passwords are redacted, streamed bodies
+    (dl/) are not recorded. transport is the Transport sending the requests.
+        fbx = Freepybox(transport=RecordingTransport('traffic.jsonl.gz'))
+    '''
+    blocking_only = True
+
+    def __init__(self, path, transport=None):
+        Transport.__init__(self)
+        self.path = path
+        self.transport = transport or Transport()
+
+
+    def create_session(self, verify):
+        return RecordingSession(self.transport.create_session(verify), self.path)
+
+
+class RecordingSession(SessionBase):
+    '''
+    HTTP session writing every request and its answer to a recording
+    '''
+    def __init__(self, session, path):
+        self.session = session
+        self.headers = session.headers
+        self._file = open_recording(path, 'w')
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+
+
+    def request(self, method, url, headers=None, data=None, timeout=None, stream=False):
+        start = time.monotonic()
+        r = self.session.request(method, url, headers=headers, data=data, timeout=timeout, stream=stream)
+        record = {
+            't': round(start - self._start, 6),
+            'elapsed': round(time.monotonic() - start, 6),
+            'method': method,
+            'path': _url_path(url),
+            'status': r.status_code,
+            'headers': {k: r.headers[k] for k in recorded_headers if k in r.headers},
+            }
+        if headers and 'Range' in headers:
+            record['range'] = headers['Range']
+        record.update(_encode_body(data, 'request'))
+        if stream:
+            record['streamed'] = True
+        else:
+            record.update(_encode_body(r.content, 'body'))
+
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+        return r
+
+
+    def close(self):
+        self.session.close()
+        with self._lock:
+            self._file.close()
+
+
+class ReplayTransport(Transport):
+    '''
+    Transport answering the requests of a blocking Freepybox from a
+    recording, without a box. Requests get the recorded answers of the
+    same method and path in the recorded order.
+        speed: None answers at once, 1 takes the recorded response times,
+            10 ten times less
+        loop: start again from the first recorded answer of a request once
+            all are used, instead of raising ReplayError
+        fbx = Freepybox(transport=ReplayTransport('traffic.jsonl.gz', speed=10))
+    '''
+    blocking_only = True
+
+    def __init__(self, path, speed=None, loop=True):
+        Transport.__init__(self)
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.records = load_recording(path)
+
+
+    def create_session(self, verify):
+        return ReplaySession(self.records, self.speed, self.loop)
+
+
+class ReplaySession(SessionBase):
+    '''
+    HTTP session answering from recorded records
+    '''
+    def __init__(self, records, speed=None, loop=True):
+        self.headers = {}
+        self.speed = speed
+        self.loop = loop
+        self._answers = {}
+        for record in records:
+            self._answers.setdefault((record['method'], record['path']), []).append(record)
+        self._next = dict.fromkeys(self._answers, 0)
+        self._lock = threading.Lock()
+
+
+    def request(self, method, url, headers=None, data=None, timeout=None, stream=False):
+        key = (method, _url_path(url))
+        with self._lock:
+            answers = self._answers.get(key)
+            if not answers or (self._next[key] >= len(answers) and not self.loop):
+                raise ReplayError('no recorded answer for {0} {1}'.format(*key))
+            record = answers[self._next[key] % len(answers)]
+            self._next[key] += 1
+
+        if self.speed:
+            time.sleep(record.get('elapsed', 0) / self.speed)
+        return ReplayResponse(record['status'], record.get('headers', {}), _decode_body(record, 'body'))
+
+
+class ReplayResponse:
+    '''
+    Subset of the requests.Response interface over a recorded answer
+    '''
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self._raw = None
+
+
+    def json(self):
+        return json.loads(self.content)
+
+
+    def iter_content(self, chunk_size=None):
+        chunk_size = chunk_size or len(self.content) or 1
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+
+    @property
+    def raw(self):
+        if self._raw is None:
+            self._raw = io.BytesIO(self.content)
+        return self._raw
+
+
+    def close(self):
+        pass
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def replay_traffic(fbx, path, speed=None, max_workers=8, repeat=1, writes=False):
+    '''
+    Send again the requests of a recording through the opened fbx, at the
+    recorded pace divided by speed, or as fast as possible with speed=None.
+    Login requests and streamed downloads are left out.
+    The POST, PUT and DELETE requests (system/reboot/, fs/rm/...) are only
+    sent when fbx answers from a ReplayTransport, or with writes=True:
+    a real box only gets the GET requests otherwise.
+    Returns {'requests', 'skipped', 'errors', 'elapsed', 'rps'}.
+    '''
+    from concurrent.futures import ThreadPoolExecutor
+
+    access = fbx._access
+    if access is None: raise NotOpenError('Freebox is Not opened')
+    prefix = urlsplit(access.base_url).path
+    records = [r for r in load_recording(path)
+               if r['path'].startswith(prefix) and not r['path'][len(prefix):].startswith('login')
+               and not r.get('streamed')]
+    skipped = 0
+    if not writes and not isinstance(access.session, ReplaySession):
+        reads = [r for r in records if r['method'] == 'GET']
+        skipped = len(records) - len(reads)
+        records = reads
+    methods = {'GET': access.get, 'POST': access.post, 'PUT': access.put, 'DELETE': access.delete}
+    errors = []
+
+    def send(record):
+        end_url = record['path'][len(prefix):]
+        body = _decode_body(record, 'request')
+        try:
+            if record['method'] in ('POST', 'PUT'):
+                methods[record['method']](end_url, json.loads(body) if body else None)
+            else:
+                methods[record['method']](end_url)
+        except Exception as e:
+            errors.append(e)
+
+    # Recorded times relative to the first replayed request
+    first = records[0]['t'] if records else 0
+    span = records[-1]['t'] - first if records else 0
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for i in range(repeat):
+            for record in records:
+                if speed:
+                    delay = start + (span * i + record['t'] - first) / speed - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                executor.submit(send, record)
+    elapsed = time.monotonic() - start
+
+    count = len(records) * repeat
+    return {'requests': count, 'skipped': skipped * repeat, 'errors': len(errors), 'elapsed': elapsed,
+            'rps': count / elapsed if elapsed else 0}
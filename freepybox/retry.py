@@ -0,0 +1,106 @@
+import random
+import threading
+import time
+from freepybox.exceptions import *
+
+
+def is_box_failure(exception):
+    '''
+    Return True if the exception means the box could not serve the request:
+    network error, timeout, 5xx status or non json answer
+    '''
+    return isinstance(exception, (ServerError, OSError))
+
+
+class RetryPolicy:
+    '''
+    Retries of requests failing on a network error or a server error
+    (5xx status or non json answer), with exponential backoff and full jitter.
+    Only idempotent methods are retried: a POST like system/reboot or
+    lan/wol/ is never sent twice. max_retries=0 disables retries.
+    '''
+    def __init__(self, max_retries=3, backoff=0.2, max_backoff=5, idempotent_methods=('GET', 'PUT', 'DELETE')):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.idempotent_methods = idempotent_methods
+
+
+    def should_retry(self, method, attempt, exception):
+        '''
+        Return True if the request failing with exception can be sent again
+        '''
+        return (attempt < self.max_retries and method in self.idempotent_methods
+                and is_box_failure(exception))
+
+
+    def delay(self, attempt):
+        '''
+        Return the seconds to wait before retry number attempt (from 0)
+        '''
+        return random.uniform(0, min(self.backoff * 2 ** attempt, self.max_backoff))
+
+
+class CircuitBreaker:
+    '''
+    Per box circuit breaker: after failure_threshold consecutive failures
+    requests fail fast with CircuitOpenError for reset_timeout seconds,
+    then a single trial request decides whether the box is back.
+    failure_threshold=None disables the breaker.
+    '''
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+
+    def before_request(self):
+        '''
+        Raise CircuitOpenError if requests to the box must fail fast.
+        Returns True when the request is the trial deciding whether the box
+        is back, end_trial() must be called once it is over.
+        '''
+        if self.failure_threshold is None:
+            return False
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if not self._trial and time.monotonic() >= self._opened_at + self.reset_timeout:
+                self._trial = True
+                return True
+            raise CircuitOpenError('box unreachable, retry in {0:.0f}s'.format(
+                max(0, self._opened_at + self.reset_timeout - time.monotonic())))
+
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+
+    def record_failure(self):
+        if self.failure_threshold is None:
+            return
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+
+    def end_trial(self):
+        '''
+        End the trial request, when it neither recorded a success nor a
+        failure the next request is a new trial
+        '''
+        with self._lock:
+            self._trial = False
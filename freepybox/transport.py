@@ -0,0 +1,226 @@
+import io
+
+
+class Transport:
+    '''
+    HTTP transport options of a Freepybox:
+        pool_connections: number of hosts the connection pools are kept for
+        pool_maxsize: connections kept open per host, set it to the number
+            of concurrent callers (batch workers...)
+        pool_block: wait for a free pooled connection instead of opening
+            an extra one which is thrown away afterwards
+        keep_alive: reuse TLS connections between requests
+        max_retries: retries of connection failures at the socket level,
+            the request itself is never sent twice
+        http2: multiplex requests on HTTP/2 connections with httpx
+            (pip install freepybox[http2]), blocking Freepybox only
+        verify: CA file the box certificate is checked against instead of
+            the freebox root CA (local test servers), False disables the check
+    '''
+    # True for the transports AsyncFreepybox cannot use
+    blocking_only = False
+
+    def __init__(self, pool_connections=1, pool_maxsize=10, pool_block=False, keep_alive=True, max_retries=0, http2=False, verify=None):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self.max_retries = max_retries
+        self.http2 = http2
+        self.verify = verify
+
+
+    def create_session(self, verify):
+        '''
+        Returns the HTTP session used by Freepybox, verify being the CA file
+        '''
+        if self.verify is not None:
+            verify = self.verify
+        if self.http2:
+            return self._create_http2_session(verify)
+
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        class VerifyAdapter(HTTPAdapter):
+            # requests prefers REQUESTS_CA_BUNDLE/CURL_CA_BUNDLE to session.verify,
+            # the box certificate must be checked against its own CA file
+            def send(self, request, **kwargs):
+                kwargs['verify'] = verify
+                return HTTPAdapter.send(self, request, **kwargs)
+
+        retries = Retry(total=self.max_retries, connect=self.max_retries, read=0, status=0, redirect=0, backoff_factor=0.1)
+        adapter = VerifyAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize,
+                                max_retries=retries, pool_block=self.pool_block)
+
+        session = requests.Session()
+        session.verify = verify
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+
+    def create_ssl_context(self, cafile):
+        '''
+        Returns the SSL context of the aiohttp connector, cafile being the CA file
+        '''
+        import ssl
+        if self.verify is False:
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            return context
+        return ssl.create_default_context(cafile=cafile if self.verify is None else self.verify)
+
+
+    def create_connector(self, ssl_context):
+        '''
+        Returns the aiohttp connector used by AsyncFreepybox
+        '''
+        import aiohttp
+        return aiohttp.TCPConnector(ssl=ssl_context, limit_per_host=self.pool_maxsize, force_close=not self.keep_alive)
+
+
+    def _create_http2_session(self, verify):
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError('HTTP/2 transport requires httpx[http2]: pip install freepybox[http2]')
+
+        # httpx deprecates CA file paths for verify, it takes a SSL context
+        context = self.create_ssl_context(verify)
+        limits = httpx.Limits(max_connections=self.pool_maxsize,
+                              max_keepalive_connections=self.pool_maxsize if self.keep_alive else 0)
+        transport = httpx.HTTPTransport(http2=True, verify=context, retries=self.max_retries, limits=limits)
+        return Http2Session(httpx.Client(transport=transport, http2=True, verify=context), verify)
+
+
+class SessionBase:
+    '''
+    Subset of the requests.Session interface used by freepybox,
+    subclasses implement request()
+    '''
+    def request(self, method, url, headers=None, data=None, timeout=None, stream=False):
+        raise NotImplementedError
+
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+
+    def post(self, url, data=None, **kwargs):
+        return self.request('POST', url, data=data, **kwargs)
+
+
+    def put(self, url, data=None, **kwargs):
+        return self.request('PUT', url, data=data, **kwargs)
+
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+
+    def close(self):
+        pass
+
+
+class Http2Session(SessionBase):
+    '''
+    requests.Session interface on top of httpx, verify being the CA file
+    '''
+    def __init__(self, client, verify=None):
+        self.client = client
+        self.headers = client.headers
+        self.verify = verify
+
+
+    def request(self, method, url, headers=None, data=None, timeout=None, stream=False):
+        import httpx
+        request = self.client.build_request(method, url, headers=headers, content=data, timeout=timeout)
+        try:
+            return Http2Response(self.client.send(request, stream=stream))
+        except httpx.TransportError as e:
+            raise ConnectionError(str(e)) from e
+
+
+    def close(self):
+        self.client.close()
+
+
+class Http2Response:
+    '''
+    Subset of the requests.Response interface used by freepybox on top of httpx
+    '''
+    def __init__(self, response):
+        self._response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self._raw = None
+
+
+    @property
+    def content(self):
+        return self._response.read()
+
+
+    def json(self):
+        self._response.read()
+        return self._response.json()
+
+
+    def iter_content(self, chunk_size=None):
+        return self._response.iter_bytes(chunk_size)
+
+
+    @property
+    def raw(self):
+        if self._raw is None:
+            self._raw = _StreamReader(self._response)
+        return self._raw
+
+
+    def close(self):
+        self._response.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class _StreamReader(io.RawIOBase):
+    '''
+    Raw binary file over the body of a streamed httpx response
+    '''
+    def __init__(self, response):
+        self._response = response
+        self._chunks = response.iter_bytes()
+        self._buffer = b''
+        self.decode_content = True
+
+
+    def readable(self):
+        return True
+
+
+    def readinto(self, b):
+        while not self._buffer:
+            self._buffer = next(self._chunks, None)
+            if self._buffer is None:
+                self._buffer = b''
+                return 0
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+    def close(self):
+        self._response.close()
+        io.RawIOBase.close(self)
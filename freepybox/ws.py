@@ -0,0 +1,63 @@
+import asyncio
+import contextlib
+from urllib.parse import urljoin
+
+
+def import_aiohttp():
+    '''
+    Returns the aiohttp module, used by the websocket APIs
+    '''
+    try:
+        import aiohttp
+    except ImportError:
+        raise ImportError('freebox websocket APIs require aiohttp: pip install freepybox[async]')
+    return aiohttp
+
+
+def ws_url(access, end_url):
+    '''
+    Returns the websocket url of end_url
+    '''
+    url = urljoin(access.base_url, end_url)
+    return 'wss' + url[len('https'):] if url.startswith('https') else 'ws' + url[len('http'):]
+
+
+def ssl_context(access):
+    '''
+    Returns the SSL option of the websockets of access: True uses the
+    context of the aiohttp connector of an AsyncAccess, the blocking
+    Access gets a context trusting the CA file of its http session
+    '''
+    aiohttp = import_aiohttp()
+    if isinstance(access.session, aiohttp.ClientSession):
+        return True
+    from freepybox.freepybox import root_ca_file
+    from freepybox.transport import Transport
+    return Transport(verify=getattr(access.session, 'verify', None)).create_ssl_context(root_ca_file)
+
+
+@contextlib.asynccontextmanager
+async def ws_session(access):
+    '''
+    Yields the aiohttp session of an AsyncAccess, or a new session
+    for the blocking Access
+    '''
+    aiohttp = import_aiohttp()
+    if isinstance(access.session, aiohttp.ClientSession):
+        yield access.session
+    else:
+        async with aiohttp.ClientSession() as session:
+            yield session
+
+
+async def renew_header(access, failed_header):
+    '''
+    Renew the session of access after a websocket handshake was refused
+    and returns the new header
+    '''
+    if access.renew_session is None:
+        return access.header
+    if asyncio.iscoroutinefunction(access._renew_header):
+        return await access._renew_header(failed_header)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, access._renew_header, failed_header)
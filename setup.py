@@ -33,8 +33,20 @@ setup(
     author_email='',
     description='Provides authentication and row access to Freebox using OS developer API',
     long_description=open('README.md').read(),
+    python_requires='>=3.7',
     install_requires=['requests'],
+    extras_require={
+        'async': ['aiohttp'],
+        'rrd': ['numpy'],
+        'http2': ['httpx[http2]'],
+        'fast-json': ['orjson'],
+    },
     include_package_data=True,
+    entry_points={
+        'console_scripts': [
+            'freepybox-exporter = freepybox.exporter:main',
+        ],
+    },
     url='https://github.com/fstercq/freepybox',
     keywords='freebox',
     classifiers=[
@@ -42,8 +54,11 @@ setup(
         'Development Status :: 3 - Alpha',
         'License :: OSI Approved :: GNU General Public License (GPL)',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
     ],
 )